@@ -1,41 +1,158 @@
-import hashlib
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hashcore import hash_file, read_full
+from manifest import MANIFEST_NAME, generate_manifest, verify_manifest
+from merkle import compare_directories
 
 def get_file_hash(file_path):
     """计算文件的 SHA-256 哈希值"""
-    sha256_hash = hashlib.sha256()
     try:
-        with open(file_path, "rb") as f:
-            # 分块读取，防止大文件撑爆内存
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        # 分块读取（复用 1 MB 缓冲区，大文件走 mmap），防止大文件撑爆内存
+        return hash_file(file_path, "sha256")
     except Exception as e:
         return f"Error: {str(e)}"
 
+COMPARE_CHUNK_SIZE = 4 * 1024 * 1024   # 逐块对比时每次读取的大小
+
+def _first_difference(a, b):
+    """返回两段等长数据中第一个不同字节的下标，先按 4 KB 粗查再逐字节定位"""
+    step = 4096
+    for start in range(0, len(a), step):
+        if a[start:start + step] != b[start:start + step]:
+            for i in range(start, min(start + step, len(a))):
+                if a[i] != b[i]:
+                    return i
+    return None
+
+def compare_files(file1, file2, chunk_size=COMPARE_CHUNK_SIZE):
+    """
+    两个线程同时读取两个文件的对齐块，发现第一个不同的块就停止。
+    每个文件两块缓冲区轮流使用：比较当前块的同时后台已在读下一块。
+    返回第一个不同字节的偏移（内容一致时为 None）和读取的总字节数。
+    """
+    buffers = [[bytearray(chunk_size), bytearray(chunk_size)] for _ in range(2)]
+    with open(file1, "rb", buffering=0) as f1, open(file2, "rb", buffering=0) as f2, \
+            ThreadPoolExecutor(max_workers=2) as executor:
+        handles = (f1, f2)
+
+        def submit(slot):
+            return [executor.submit(read_full, handles[i], buffers[i][slot]) for i in range(2)]
+
+        slot = 0
+        offset = 0
+        bytes_read = 0
+        pending = submit(slot)
+        while True:
+            n1, n2 = (future.result() for future in pending)
+            bytes_read += n1 + n2
+            if n1 == n2 == chunk_size:
+                pending = submit(1 - slot)
+            a, b = buffers[0][slot], buffers[1][slot]
+            if n1 != chunk_size or n2 != chunk_size:
+                a, b = a[:n1], b[:n2]  # 只有最后一块需要切片；整块直接比较 bytearray，走 memcmp
+            if a != b:
+                # 每块都已尽量读满，长度不同说明较短的一侧已到文件末尾，差异位于它的末尾
+                common = min(n1, n2)
+                index = _first_difference(a[:common], b[:common])
+                return offset + (common if index is None else index), bytes_read
+            if n1 < chunk_size:
+                return None, bytes_read
+            offset += n1
+            slot = 1 - slot
+
+def compare_by_digest(file1, file2):
+    """分别计算两个文件的完整 SHA-256（两个文件并行计算）"""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        hash1, hash2 = executor.map(get_file_hash, (file1, file2))
+    print(f"Hash 1: {hash1}")
+    print(f"Hash 2: {hash2}")
+    return hash1 == hash2 and not hash1.startswith("Error")
+
+def compare_two_files(file1, file2, with_digest=False):
+    print(f"正在对比:\n1: {os.path.basename(file1)}\n2: {os.path.basename(file2)}\n")
+    started = time.perf_counter()
+    bytes_read = 0
+
+    if with_digest:
+        same = compare_by_digest(file1, file2)
+        bytes_read = sum(os.path.getsize(f) for f in (file1, file2) if os.path.isfile(f))
+        detail = ""
+    else:
+        try:
+            size1, size2 = os.path.getsize(file1), os.path.getsize(file2)
+        except OSError as e:
+            print(f"Error: {e}")
+            return False
+        if size1 != size2:
+            # 大小不同，不必读取内容
+            same = False
+            detail = f"大小不同：{size1} 字节 / {size2} 字节"
+        else:
+            try:
+                offset, bytes_read = compare_files(file1, file2)
+            except OSError as e:
+                print(f"Error: {e}")
+                return False
+            same = offset is None
+            detail = "" if same else f"第一个不同字节的偏移：{offset}（0x{offset:x}）"
+
+    elapsed = time.perf_counter() - started
+    print("-" * 30)
+    if detail:
+        print(detail)
+    print(f"读取 {bytes_read / 1024 ** 2:.1f} MB，用时 {elapsed:.2f} 秒，"
+          f"{bytes_read / max(elapsed, 1e-6) / 1024 ** 2:.1f} MB/秒")
+    if same:
+        print("结果：文件内容完全一致！ (MATCH)")
+    else:
+        print("结果：文件内容不同。 (DIFFERENT)")
+    return same
+
+def run_manifest_mode(mode, args):
+    """
+    清单模式：
+      check_hash.py --manifest <目录> [清单文件]   生成 SHA256SUMS（与 sha256sum -c 兼容）
+      check_hash.py --verify <目录> [清单文件]     按清单校验，只输出不一致和缺失的文件
+    清单文件默认为目录下的 SHA256SUMS。
+    """
+    if not args or not os.path.isdir(args[0]):
+        print(run_manifest_mode.__doc__)
+        return 2
+    root_dir = args[0]
+    manifest_path = args[1] if len(args) > 1 else os.path.join(root_dir, MANIFEST_NAME)
+    if mode == "--manifest":
+        ok = generate_manifest(root_dir, manifest_path)
+    else:
+        if not os.path.isfile(manifest_path):
+            print(f"找不到清单文件：{manifest_path}")
+            return 2
+        ok = verify_manifest(root_dir, manifest_path)
+    return 0 if ok else 1
+
 def main():
     # sys.argv[0] 是脚本路径，随后的才是拖入的文件
     files = sys.argv[1:]
 
+    if files and files[0] in ("--manifest", "--verify"):
+        sys.exit(run_manifest_mode(files[0], files[1:]))
+    if files and files[0] == "--tree":
+        # 目录比较：check_hash.py --tree <目录1> <目录2>，Merkle 树缓存在 merkle_cache/ 下
+        if len(files) != 3 or not all(os.path.isdir(d) for d in files[1:]):
+            print("用法：check_hash.py --tree <目录1> <目录2>")
+            sys.exit(2)
+        sys.exit(0 if compare_directories(files[1], files[2]) else 1)
+
+    # 加 --digest 时计算并显示两个文件的完整哈希，否则逐块对比，遇到第一个不同处就停止
+    with_digest = "--digest" in files
+    files = [f for f in files if f != "--digest"]
+
     if len(files) < 2:
         print("提示：请同时选中两个文件并拖入此脚本。")
     else:
-        file1, file2 = files[0], files[1]
-        
-        print(f"正在对比:\n1: {os.path.basename(file1)}\n2: {os.path.basename(file2)}\n")
-
-        hash1 = get_file_hash(file1)
-        hash2 = get_file_hash(file2)
-
-        print(f"Hash 1: {hash1}")
-        print(f"Hash 2: {hash2}")
-        print("-" * 30)
-
-        if hash1 == hash2:
-            print("结果：文件内容完全一致！ (MATCH)")
-        else:
-            print("结果：文件内容不同。 (DIFFERENT)")
+        compare_two_files(files[0], files[1], with_digest)
 
     print("\n按回车键退出...")
     input()
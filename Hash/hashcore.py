@@ -0,0 +1,146 @@
+"""
+通用文件哈希模块，供 check_hash、文件查重、图片整理 共用。
+
+- 可选算法：md5 / sha256（兼容已有结果）、blake2b（CPU 没有 SHA 指令加速时通常最快）
+- 读取时复用每个线程自己的大缓冲区（readinto + memoryview），不为每次读取分配新对象
+- 大文件走 mmap，由内核直接映射页缓存
+- hash_files 可以并行计算多个互不相关的文件
+
+直接运行本文件会执行微基准测试，输出各算法在不同缓冲区大小下的吞吐量（GB/s）。
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024       # 1 MiB，比 4~8 KB 的小块读取系统调用次数少两个数量级
+MMAP_THRESHOLD = 256 * 1024 * 1024      # 大于该大小的文件使用 mmap
+MMAP_STEP = 64 * 1024 * 1024            # mmap 时每次交给 hashlib 的数据量
+
+_local = threading.local()
+
+
+def new_hasher(algorithm):
+    try:
+        return ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"不支持的哈希算法：{algorithm}（可选 {', '.join(ALGORITHMS)}）")
+
+
+def get_buffer(size=DEFAULT_BUFFER_SIZE):
+    """返回当前线程复用的缓冲区视图"""
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = bytearray(size)
+        _local.buffer = buffer
+    return memoryview(buffer)
+
+
+def read_full(f, buffer):
+    """
+    无缓冲的 readinto 可能只读到一部分，循环读取直到填满缓冲区或到达文件末尾，
+    返回实际读取的字节数（小于缓冲区长度说明已到文件末尾）
+    """
+    view = memoryview(buffer)
+    total = 0
+    while total < len(view):
+        n = f.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+def _update_from_file(hasher, f, view, limit=None):
+    """用 readinto 把文件内容读入复用缓冲区并更新哈希，limit 为最多读取的字节数"""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        target = view if remaining is None or remaining >= len(view) else view[:remaining]
+        n = f.readinto(target)
+        if not n:
+            break
+        hasher.update(target[:n])
+        if remaining is not None:
+            remaining -= n
+
+
+def hash_file(file_path, algorithm="sha256", buffer_size=DEFAULT_BUFFER_SIZE, use_mmap=None):
+    """
+    计算文件的十六进制摘要。
+    use_mmap 为 None 时按文件大小自动选择：超过 MMAP_THRESHOLD 使用 mmap，否则使用 readinto。
+    """
+    hasher = new_hasher(algorithm)
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap is None:
+            use_mmap = size >= MMAP_THRESHOLD
+        if use_mmap and size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                for offset in range(0, size, MMAP_STEP):
+                    hasher.update(view[offset:offset + MMAP_STEP])
+        else:
+            _update_from_file(hasher, f, get_buffer(buffer_size))
+    return hasher.hexdigest()
+
+
+def hash_ranges(file_path, ranges, algorithm="md5", buffer_size=DEFAULT_BUFFER_SIZE):
+    """只读取指定的 (偏移, 长度) 区间并计算摘要"""
+    hasher = new_hasher(algorithm)
+    view = get_buffer(buffer_size)
+    with open(file_path, "rb", buffering=0) as f:
+        for offset, length in ranges:
+            f.seek(offset)
+            _update_from_file(hasher, f, view, length)
+    return hasher.hexdigest()
+
+
+def hash_files(file_paths, algorithm="sha256", workers=None, **kwargs):
+    """
+    并行计算多个互不相关文件的摘要，按输入顺序产出 (路径, 摘要)。
+    读取失败的文件产出 (路径, 异常对象)。hashlib 处理大块数据时会释放 GIL，线程即可利用多核。
+    """
+    def job(path):
+        try:
+            return hash_file(path, algorithm, **kwargs)
+        except OSError as e:
+            return e
+
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from zip(file_paths, executor.map(job, file_paths))
+
+
+def benchmark(file_size=256 * 1024 * 1024, buffer_sizes=(4096, 8192, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024)):
+    """微基准：对一个临时文件（已在页缓存中）测量各算法、各缓冲区大小以及 mmap 的吞吐量"""
+    fd, path = tempfile.mkstemp(prefix="hash_bench_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(file_size // len(chunk)):
+                f.write(chunk)
+        hash_file(path, "md5")  # 预热页缓存
+
+        print(f"测试文件大小：{file_size / 1024 / 1024:.0f} MB")
+        print(f"{'算法':<10}{'读取方式':>14}{'GB/s':>10}")
+        for algorithm in ALGORITHMS:
+            cases = [(f"{size // 1024} KB", size, False) for size in buffer_sizes] + [("mmap", DEFAULT_BUFFER_SIZE, True)]
+            for label, buffer_size, use_mmap in cases:
+                started = time.perf_counter()
+                hash_file(path, algorithm, buffer_size, use_mmap)
+                elapsed = time.perf_counter() - started
+                print(f"{algorithm:<10}{label:>14}{file_size / elapsed / 1024 ** 3:>10.2f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,253 @@
+"""
+目录树校验清单：生成与 sha256sum 兼容的 SHA256SUMS 清单，或按清单校验目录树。
+
+两种模式都多线程并行计算哈希，并把进度写入检查点文件，中断后再次运行会从上次停下的位置继续。
+"""
+import json
+import os
+import time
+
+from hashcore import hash_files
+
+MANIFEST_NAME = "SHA256SUMS"
+BATCH_SIZE = 256            # 每批提交给线程池的文件数，同时也是检查点的写入粒度
+PROGRESS_INTERVAL = 1.0     # 进度行刷新间隔（秒）
+
+
+def _escape_path(path):
+    """按 sha256sum 的规则转义路径：含反斜杠或换行时整行以反斜杠开头"""
+    if "\\" in path or "\n" in path:
+        return True, path.replace("\\", "\\\\").replace("\n", "\\n")
+    return False, path
+
+
+def _unescape_path(path):
+    result = []
+    chars = iter(path)
+    for ch in chars:
+        if ch == "\\":
+            nxt = next(chars, "")
+            result.append("\n" if nxt == "n" else nxt)
+        else:
+            result.append(ch)
+    return "".join(result)
+
+
+def format_line(digest, rel_path):
+    escaped, path = _escape_path(rel_path)
+    prefix = "\\" if escaped else ""
+    return f"{prefix}{digest}  {path}\n"
+
+
+def parse_line(line):
+    """解析一行清单，返回 (摘要, 相对路径)，空行或注释返回 None"""
+    line = line.rstrip("\n")
+    if not line or line.startswith("#"):
+        return None
+    escaped = line.startswith("\\")
+    if escaped:
+        line = line[1:]
+    digest, rest = line[:64], line[64:]
+    # 文本模式为两个空格，二进制模式为 " *"
+    path = rest[2:]
+    return digest.lower(), _unescape_path(path) if escaped else path
+
+
+def read_manifest(manifest_path):
+    entries = []
+    with open(manifest_path, "r", encoding="utf-8", newline="\n") as f:
+        for line in f:
+            parsed = parse_line(line)
+            if parsed:
+                entries.append(parsed)
+    return entries
+
+
+def list_tree(root_dir, exclude=()):
+    """按排序后的顺序列出目录树下所有文件的相对路径（统一使用 / 分隔）"""
+    exclude = {os.path.normcase(os.path.abspath(path)) for path in exclude}
+    for root, dirs, files in os.walk(root_dir):
+        dirs.sort()
+        for name in sorted(files):
+            full_path = os.path.join(root, name)
+            if os.path.normcase(os.path.abspath(full_path)) in exclude:
+                continue
+            yield os.path.relpath(full_path, root_dir).replace(os.sep, "/")
+
+
+class Throughput:
+    """统计并定时打印处理速度"""
+
+    def __init__(self, total_files=None):
+        self.started = time.perf_counter()
+        self.last_print = 0.0
+        self.files = 0
+        self.bytes = 0
+        self.total_files = total_files
+
+    def add(self, num_bytes):
+        self.files += 1
+        self.bytes += num_bytes
+        now = time.perf_counter()
+        if now - self.last_print >= PROGRESS_INTERVAL:
+            self.last_print = now
+            print(f"\r{self.status()}", end="", flush=True)
+
+    def status(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        count = f"{self.files}/{self.total_files}" if self.total_files else f"{self.files}"
+        return (f"已处理 {count} 个文件，{self.bytes / 1024 ** 3:.2f} GB，"
+                f"{self.files / elapsed:.1f} 文件/秒，{self.bytes / elapsed / 1024 ** 2:.1f} MB/秒")
+
+    def finish(self):
+        print(f"\r{self.status()}，用时 {time.perf_counter() - self.started:.1f} 秒")
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _truncate_torn_line(path, block_size=64 * 1024):
+    """
+    检查点文件只追加完整的行，中断时最后可能留下半行：截掉最后一个换行符之后的内容，
+    否则续写的第一行会接在半行后面，两条记录一起损坏
+    """
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(pos - block_size, 0)
+            f.seek(start)
+            index = f.read(pos - start).rfind(b"\n")
+            if index >= 0:
+                pos = start + index + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def generate_manifest(root_dir, manifest_path=None, workers=None):
+    """
+    为目录树生成 SHA256SUMS 清单。
+    结果先逐批追加到 <清单>.partial，中断后再次运行会跳过其中已有的文件，完成后再改名为正式清单。
+    """
+    manifest_path = manifest_path or os.path.join(root_dir, MANIFEST_NAME)
+    partial_path = manifest_path + ".partial"
+
+    done = set()
+    if os.path.exists(partial_path):
+        _truncate_torn_line(partial_path)
+        done = {path for _, path in read_manifest(partial_path)}
+        print(f"从检查点继续，已完成 {len(done)} 个文件")
+
+    rel_paths = [p for p in list_tree(root_dir, [manifest_path, partial_path]) if p not in done]
+    stats = Throughput(len(rel_paths) + len(done))
+    stats.files = len(done)
+    errors = 0
+
+    with open(partial_path, "a", encoding="utf-8", newline="\n") as out:
+        for batch in _batches(rel_paths, BATCH_SIZE):
+            full_paths = [os.path.join(root_dir, p) for p in batch]
+            for rel_path, (full_path, digest) in zip(batch, hash_files(full_paths, "sha256", workers)):
+                if isinstance(digest, Exception):
+                    errors += 1
+                    print(f"\n读取失败：{rel_path}（{digest}）")
+                    continue
+                out.write(format_line(digest, rel_path))
+                stats.add(_file_size(full_path))
+            # 每批结束刷新到磁盘，作为断点续传的检查点
+            out.flush()
+            os.fsync(out.fileno())
+
+    os.replace(partial_path, manifest_path)
+    stats.finish()
+    print(f"清单已生成：{manifest_path}" + (f"，{errors} 个文件读取失败" if errors else ""))
+    return errors == 0
+
+
+def verify_manifest(root_dir, manifest_path=None, workers=None):
+    """
+    按清单校验目录树，只输出不一致、缺失和读取失败的文件。
+    已校验的结果逐批写入 <清单>.verify，中断后再次运行从上次的位置继续，全部完成后删除。
+    """
+    manifest_path = manifest_path or os.path.join(root_dir, MANIFEST_NAME)
+    checkpoint_path = manifest_path + ".verify"
+    entries = read_manifest(manifest_path)
+
+    # 检查点中每行是一个 JSON：{"path": 相对路径, "status": "ok"/"mismatch"/"missing"/"error"}
+    results = {}
+    if os.path.exists(checkpoint_path):
+        _truncate_torn_line(checkpoint_path)
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 中断时可能写了半行
+                results[record["path"]] = record["status"]
+        print(f"从检查点继续，已校验 {len(results)} 个文件")
+        for path, status in results.items():
+            if status != "ok":
+                _report(status, path)
+
+    pending = [(digest, path) for digest, path in entries if path not in results]
+    stats = Throughput(len(entries))
+    stats.files = len(results)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for batch in _batches(pending, BATCH_SIZE):
+            records = []
+            to_hash = []
+            for expected, rel_path in batch:
+                full_path = os.path.join(root_dir, *rel_path.split("/"))
+                if not os.path.isfile(full_path):
+                    records.append((rel_path, "missing"))
+                    stats.add(0)
+                else:
+                    to_hash.append((expected, rel_path, full_path))
+
+            digests = hash_files([full_path for _, _, full_path in to_hash], "sha256", workers)
+            for (expected, rel_path, full_path), (_, actual) in zip(to_hash, digests):
+                if isinstance(actual, Exception):
+                    records.append((rel_path, "error"))
+                else:
+                    records.append((rel_path, "ok" if actual == expected else "mismatch"))
+                stats.add(_file_size(full_path))
+
+            for rel_path, status in records:
+                results[rel_path] = status
+                if status != "ok":
+                    _report(status, rel_path)
+                checkpoint.write(json.dumps({"path": rel_path, "status": status}, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+
+    os.remove(checkpoint_path)
+    stats.finish()
+
+    counts = {}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    print(f"校验完成：一致 {counts.get('ok', 0)}，不一致 {counts.get('mismatch', 0)}，"
+          f"缺失 {counts.get('missing', 0)}，读取失败 {counts.get('error', 0)}")
+    return len(results) == counts.get("ok", 0)
+
+
+def _report(status, rel_path):
+    label = {"mismatch": "不一致", "missing": "缺失", "error": "读取失败"}[status]
+    print(f"\n{label}：{rel_path}")
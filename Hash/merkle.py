@@ -0,0 +1,162 @@
+"""
+目录 Merkle 树：每个文件的哈希是叶子，目录的哈希由其子项的名称和哈希组合而成。
+
+树保存在缓存目录中，再次构建时大小和修改时间都没变的文件直接复用上次的哈希，
+比较两棵树时只深入根哈希不同的子目录。镜像目录大部分未变化时，重新校验几乎只剩下 stat 的开销。
+"""
+import hashlib
+import json
+import os
+
+from hashcore import hash_files
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "merkle_cache")
+TREE_ALGORITHM = "sha256"
+
+
+def cache_path_for(root_dir):
+    """每个目录一个缓存文件，文件名取绝对路径的哈希"""
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(root_dir)).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def load_tree(root_dir):
+    try:
+        with open(cache_path_for(root_dir), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("algorithm") != TREE_ALGORITHM:
+        return None
+    return data.get("tree")
+
+
+def save_tree(root_dir, tree):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path_for(root_dir)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"root": os.path.abspath(root_dir), "algorithm": TREE_ALGORITHM, "tree": tree},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def _scan(dir_path, cached, pending):
+    """
+    只做 stat，建立目录节点。
+    叶子节点为 {"size", "mtime_ns", "hash"}；大小和修改时间与缓存一致时沿用缓存中的哈希，
+    否则先把 hash 置空，并把 (节点, 路径) 放进 pending 等待统一并行计算。
+    """
+    cached_children = (cached or {}).get("children", {})
+    children = {}
+    try:
+        entries = sorted(os.scandir(dir_path), key=lambda e: e.name)
+    except OSError as e:
+        print(f"无法读取目录：{dir_path}（{e}）")
+        entries = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                old = cached_children.get(entry.name)
+                children[entry.name] = _scan(entry.path, old if old and "children" in old else None, pending)
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                old = cached_children.get(entry.name)
+                if old and old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns and old.get("hash"):
+                    children[entry.name] = old
+                else:
+                    leaf = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": None}
+                    children[entry.name] = leaf
+                    pending.append((leaf, entry.path))
+        except OSError as e:
+            print(f"无法读取：{entry.path}（{e}）")
+    return {"hash": None, "children": children}
+
+
+def _seal(node):
+    """自底向上计算目录哈希：对排序后的 "类型 名称 子哈希" 逐行求哈希"""
+    hasher = hashlib.new(TREE_ALGORITHM)
+    for name in sorted(node["children"]):
+        child = node["children"][name]
+        if "children" in child:
+            kind = "d"
+            _seal(child)
+        else:
+            kind = "f"
+        hasher.update(f"{kind}\0{name}\0{child['hash']}\n".encode("utf-8", "surrogateescape"))
+    node["hash"] = hasher.hexdigest()
+
+
+def build_tree(root_dir, workers=None):
+    """
+    构建（或增量更新）目录的 Merkle 树并写回缓存，返回 (树, 重新计算哈希的文件数, 复用的文件数)。
+    """
+    cached = load_tree(root_dir)
+    pending = []
+    tree = _scan(root_dir, cached, pending)
+
+    total = sum(1 for _ in _iter_leaves(tree))
+    for (leaf, path), (_, digest) in zip(pending, hash_files([p for _, p in pending], TREE_ALGORITHM, workers)):
+        if isinstance(digest, Exception):
+            print(f"读取失败：{path}（{digest}）")
+            # 读取失败的文件不进缓存，且用带绝对路径的占位值保证两侧不会误判为相同
+            leaf["hash"] = f"!{os.path.abspath(path)}"
+            leaf["size"] = -1
+        else:
+            leaf["hash"] = digest
+    _seal(tree)
+    save_tree(root_dir, tree)
+    return tree, len(pending), total - len(pending)
+
+
+def _iter_leaves(node):
+    for child in node["children"].values():
+        if "children" in child:
+            yield from _iter_leaves(child)
+        else:
+            yield child
+
+
+def diff_trees(left, right, prefix=""):
+    """
+    比较两棵树，产出 (状态, 相对路径)，状态为 "left_only" / "right_only" / "changed" / "type"。
+    根哈希相同的子目录直接跳过，不再向下比较。
+    """
+    if left["hash"] == right["hash"]:
+        return
+    left_children, right_children = left["children"], right["children"]
+    for name in sorted(left_children.keys() | right_children.keys()):
+        rel_path = f"{prefix}{name}"
+        a, b = left_children.get(name), right_children.get(name)
+        if b is None:
+            yield "left_only", rel_path
+        elif a is None:
+            yield "right_only", rel_path
+        elif ("children" in a) != ("children" in b):
+            yield "type", rel_path
+        elif "children" in a:
+            yield from diff_trees(a, b, rel_path + "/")
+        elif a["hash"] != b["hash"]:
+            yield "changed", rel_path
+
+
+def compare_directories(left_dir, right_dir, workers=None):
+    """比较两个目录，只输出差异，返回两侧是否完全一致"""
+    labels = {"left_only": "仅在 1 中", "right_only": "仅在 2 中", "changed": "内容不同", "type": "类型不同"}
+    trees = []
+    for index, root_dir in enumerate((left_dir, right_dir), 1):
+        tree, hashed, reused = build_tree(root_dir, workers)
+        print(f"{index}: {root_dir}\n   重新计算 {hashed} 个文件，复用缓存 {reused} 个文件，根哈希 {tree['hash'][:16]}")
+        trees.append(tree)
+
+    print("-" * 30)
+    differences = 0
+    for status, rel_path in diff_trees(*trees):
+        differences += 1
+        print(f"{labels[status]}：{rel_path}")
+
+    if differences:
+        print(f"结果：共 {differences} 处差异。 (DIFFERENT)")
+    else:
+        print("结果：两个目录内容完全一致！ (MATCH)")
+    return differences == 0
@@ -0,0 +1,186 @@
+import difflib
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit
+
+# 网址规范化：按顺序应用可配置的规则，得到用于判断重复的规范键。
+# 只处理 http/https 网址，其他协议（javascript:、file:、place: 等）原样比较。
+
+TRACKING_PREFIXES = ("utm_",)
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid"}
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def _rule_host(parts):
+    parts["scheme"] = parts["scheme"].lower()
+    parts["host"] = parts["host"].lower()
+    if parts["port"] == DEFAULT_PORTS.get(parts["scheme"]):
+        parts["port"] = ""
+
+
+def _rule_scheme(parts):
+    if parts["scheme"] == "https":
+        parts["scheme"] = "http"
+
+
+def _rule_www(parts):
+    if parts["host"].startswith("www."):
+        parts["host"] = parts["host"][4:]
+
+
+def _rule_slash(parts):
+    parts["path"] = parts["path"].rstrip("/")
+
+
+def _rule_tracking(parts):
+    if parts["query"]:
+        params = [param for param in parts["query"].split("&")
+                  if param and not _is_tracking(param.split("=", 1)[0])]
+        parts["query"] = "&".join(params)
+
+
+def _rule_fragment(parts):
+    parts["fragment"] = ""
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+# 规则名 -> (说明, 处理函数)，按此顺序应用
+RULES = {
+    "host": ("协议和域名大小写、默认端口", _rule_host),
+    "scheme": ("http/https 视为相同", _rule_scheme),
+    "www": ("忽略 www. 前缀", _rule_www),
+    "slash": ("忽略末尾的 /", _rule_slash),
+    "tracking": ("去掉 utm_* 等跟踪参数", _rule_tracking),
+    "fragment": ("去掉 # 之后的片段", _rule_fragment),
+}
+DEFAULT_RULES = tuple(RULES)
+
+
+def parse_rules(text):
+    """解析命令行中的规则列表（逗号分隔），none 表示只合并完全相同的网址"""
+    if text.strip().lower() == "none":
+        return ()
+    rules = tuple(name.strip() for name in text.split(",") if name.strip())
+    unknown = [name for name in rules if name not in RULES]
+    if unknown:
+        raise ValueError(f"未知的规则：{', '.join(unknown)}，可用规则：{', '.join(RULES)}")
+    # 按固定顺序应用，与命令行中的书写顺序无关
+    return tuple(name for name in RULES if name in rules)
+
+
+def _split(url):
+    try:
+        split = urlsplit(url.strip())
+        port = split.port
+    except ValueError:
+        return None
+    if split.scheme.lower() not in DEFAULT_PORTS or not split.hostname:
+        return None
+    # split.hostname 已转成小写，这里保留原始大小写，由 host 规则处理
+    host = split.netloc.rpartition("@")[2]
+    if port is not None:
+        host = host.rsplit(":", 1)[0]
+    return {
+        "scheme": split.scheme,
+        "host": host,
+        "port": str(port) if port is not None else "",
+        "path": split.path,
+        "query": split.query,
+        "fragment": split.fragment,
+    }
+
+
+def _join(parts):
+    netloc = parts["host"] + (":" + parts["port"] if parts["port"] else "")
+    return urlunsplit((parts["scheme"], netloc, parts["path"], parts["query"], parts["fragment"]))
+
+
+def canonical_url(url, rules=DEFAULT_RULES):
+    """规范键：应用全部规则后的网址；无法解析或不是 http/https 的网址原样返回"""
+    parts = _split(url)
+    if parts is None:
+        return url
+    for name in rules:
+        RULES[name][1](parts)
+    return _join(parts)
+
+
+def merged_by(urls, rules=DEFAULT_RULES):
+    """
+    一组规范键相同的网址是由哪些规则合并的：去掉某条规则后这组网址不再全部相同，就说明需要这条规则。
+    没有哪条规则是必需的（几条规则都能起同样作用）时，列出改变过其中网址的规则。
+    """
+    urls = set(urls)
+    labels = [RULES[name][0] for name in rules
+              if len({canonical_url(url, tuple(rule for rule in rules if rule != name)) for url in urls}) > 1]
+    if not labels:
+        labels = [RULES[name][0] for name in rules if any(canonical_url(url, (name,)) != url for url in urls)]
+    return labels
+
+
+# ---------------- 近似重复 ----------------
+
+SIMILARITY_THRESHOLD = 0.9
+NEIGHBOR_WINDOW = 5   # 排序后只与之后的这么多个网址比较
+
+
+def _block_key(key):
+    """分块：同一域名、同一个一级路径的网址才可能是近似重复"""
+    parts = _split(key)
+    if parts is None:
+        return None
+    first = parts["path"].lstrip("/").split("/", 1)[0]
+    return parts["host"].lower(), first
+
+
+def _tail(key):
+    parts = _split(key)
+    return parts["path"] + ("?" + parts["query"] if parts["query"] else "")
+
+
+def find_near_duplicates(keys, threshold=SIMILARITY_THRESHOLD, window=NEIGHBOR_WINDOW):
+    """
+    在不同的规范键之间查找近似重复：先按 (域名, 一级路径) 分块，块内按路径排序，
+    每个键只与排在它后面的 window 个键比较路径相似度，避免两两比较。
+    返回 [(键列表, 最低相似度)]，每组至少两个键。
+    """
+    blocks = defaultdict(list)
+    for key in keys:
+        block = _block_key(key)
+        if block is not None:
+            blocks[block].append(key)
+
+    parent = {}
+
+    def find(key):
+        while parent.get(key, key) != key:
+            key = parent[key]
+        return key
+
+    similarity = {}
+    for block_keys in blocks.values():
+        if len(block_keys) < 2:
+            continue
+        items = sorted((_tail(key), key) for key in block_keys)
+        for i, (tail, key) in enumerate(items):
+            for other_tail, other in items[i + 1:i + 1 + window]:
+                matcher = difflib.SequenceMatcher(None, tail, other_tail, autojunk=False)
+                if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+                    continue
+                ratio = matcher.ratio()
+                if ratio < threshold:
+                    continue
+                a, b = find(key), find(other)
+                if a != b:
+                    parent[b] = a
+                similarity[key] = min(similarity.get(key, 1.0), ratio)
+                similarity[other] = min(similarity.get(other, 1.0), ratio)
+
+    groups = defaultdict(list)
+    for key in similarity:
+        groups[find(key)].append(key)
+    return [(sorted(members), min(similarity[key] for key in members))
+            for members in groups.values() if len(members) > 1]
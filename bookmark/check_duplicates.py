@@ -1,123 +1,353 @@
 import sys
 from collections import defaultdict
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 
-def extract_urls_and_positions(file_path):
-    """
-    从 HTML 书签文件中提取网址及其在书签层级中的位置，以及所在行数。
-    """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        soup = BeautifulSoup(f, 'html.parser')
+from canonical import DEFAULT_RULES, canonical_url, find_near_duplicates, merged_by, parse_rules
 
-    urls_and_positions = []
-    
-    # 查找所有包含书签链接的 <A> 标签
-    all_links = soup.find_all('a', href=True)
-
-    for link in all_links:
-        url = link.get('href')
-        if not url:
-            continue
-
-        # 获取当前 <A> 标签所在的行号
-        # line_number = link.sourceline
-        
-        # 找到包含该 <a> 标签的最内层 <DL> 标签（也就是所在文件夹）
-        current_node = link
-        folder_dl = None
-        while current_node:
-            if current_node.name == 'dl':
-                folder_dl = current_node
-                break
-            current_node = current_node.parent
-
-        # 在该文件夹 <DL> 中统计当前书签是第几个 <a> 标签
-        line_number = 1
-        if folder_dl:
-            count = 0
-            for tag in folder_dl.find_all('a', href=True, recursive=True):
-                # 只统计直接子级的 a，不统计嵌套的 DL 中的 a
-                if tag.find_parent('dl') == folder_dl:
-                    count += 1
-                    if tag == link:
-                        line_number = count
+# 书签文件（Netscape 格式）中 <DT>、<p> 等标签通常不闭合，下面的解析按 html.parser 的规则处理：
+# 结束标签关闭最近一个同名的未闭合标签（中间的标签一并关闭），没有同名标签时忽略；空元素不入栈。
+# 栈中相邻的同名普通标签合并为一项计数，因此未闭合的 <DT> 不会随书签数量增长，栈的大小只与文件夹层级有关。
+
+READ_SIZE = 64 * 1024
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+}
+_UNSET = object()
+
+
+class _Node:
+    """栈中的一项：tag 相同的相邻普通标签合并，count 记录合并的数量"""
+    __slots__ = ('tag', 'count', 'first_h3', 'path', 'links', 'parts')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.count = 1
+        self.first_h3 = _UNSET   # <dt>：其中第一个 <h3>
+        self.path = ()           # <dl>：所在文件夹路径（各层文件夹所在的 <dt>）
+        self.links = 0           # <dl>：直接属于该文件夹的 <a href> 数量
+        self.parts = None        # <h3> 及其内部标签：子节点，用于得到标题文字
+
+
+def _node_string(node):
+    """与 BeautifulSoup 的 .string 相同：只有一个子节点时取其文字，否则为 None"""
+    if node.parts is None or len(node.parts) != 1:
+        return None
+    part = node.parts[0]
+    return part if isinstance(part, str) else _node_string(part)
+
+
+class BookmarkParser(HTMLParser):
+    """逐个标签处理书签文件：维护标签栈、文件夹路径和每个文件夹的书签计数，每个标签只做常数量的工作"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.dl = None        # 最内层未闭合的 <dl>
+        self.h3_depth = 0     # 位于 <h3> 内部的层数
+        self.text_open = False  # 下一段文字是否与上一段属于同一个文字节点（任何标签都会结束文字节点）
+        self.closed_void = defaultdict(int)  # 已自动闭合的空元素，之后对应的结束标签直接忽略
+        self.links = []       # (网址, 文件夹路径, 行数)
+
+    def handle_starttag(self, tag, attrs, close_void=True):
+        self.text_open = False
+        top = self.stack[-1] if self.stack else None
+
+        if tag == 'a':
+            attrs = dict(attrs)
+            if 'href' in attrs:   # <a href> 也算（值为空）
+                href = attrs['href']
+                line_number = 1
+                path = ()
+                if self.dl is not None:
+                    self.dl.links += 1
+                    line_number = self.dl.links
+                    path = self.dl.path
+                if href:
+                    self.add_link(href, attrs, path, line_number)
+
+        void = close_void and tag in VOID_TAGS
+        if void:
+            self.closed_void[tag] += 1
+        if self.h3_depth:
+            node = _Node(tag)
+            node.parts = []
+            top.parts.append(node)
+            if void:
+                return
+        elif void:
+            return
+        elif tag not in ('dl', 'h3') and top is not None and top.tag == tag and top.first_h3 is _UNSET:
+            top.count += 1
+            return
+        else:
+            node = _Node(tag)
+
+        if tag == 'dl':
+            node.path = self.dl.path if self.dl is not None else ()
+            if top is not None and top.tag == 'dt':
+                if top.count > 1:
+                    # 文件夹的 <dt> 必须单独成项，之后关闭合并项中的其他 <dt> 时不会影响它
+                    top.count -= 1
+                    first_h3 = top.first_h3
+                    top = _Node('dt')
+                    top.first_h3 = first_h3
+                    self.stack.append(top)
+                node.path += (top,)
+            self.dl = node
+        elif tag == 'h3':
+            node.parts = []
+            # 第一个 <h3> 属于所有尚未遇到 <h3> 的未闭合 <dt>；已有 <h3> 的 <dt> 之下的 <dt> 必然也已有
+            for entry in reversed(self.stack):
+                if entry.tag == 'dt':
+                    if entry.first_h3 is not _UNSET:
                         break
+                    entry.first_h3 = node
+        if node.parts is not None:
+            self.h3_depth += 1
+        self.stack.append(node)
+
+    def add_link(self, href, attrs, path, line_number):
+        """每个有网址的 <a> 调用一次；path 为各层文件夹所在的 <dt>，名称用 folder_names 取得"""
+        self.links.append((href, path, line_number))
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/>：先入栈再立即关闭（与 BeautifulSoup 相同，空元素也不例外）
+        self.handle_starttag(tag, attrs, close_void=False)
+        self._close_tag(tag)
+
+    def handle_endtag(self, tag):
+        if self.closed_void.get(tag):
+            self.closed_void[tag] -= 1
+        else:
+            self._close_tag(tag)
+
+    def _close_tag(self, tag):
+        self.text_open = False
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index].tag == tag:
+                break
+        else:
+            return
+        node = self.stack[index]
+        closed = self.stack[index + 1:]
+        del self.stack[index + 1:]
+        if node.count > 1:
+            node.count -= 1
+        else:
+            closed.append(self.stack.pop())
+
+        for entry in closed:
+            if entry.parts is not None:
+                self.h3_depth -= 1
+        if any(entry is self.dl for entry in closed):
+            self.dl = next((entry for entry in reversed(self.stack) if entry.tag == 'dl'), None)
 
+    def handle_data(self, data):
+        if self.h3_depth:
+            parts = self.stack[-1].parts
+            if self.text_open:
+                parts[-1] += data
+            else:
+                parts.append(data)
+            self.text_open = True
 
+    def handle_comment(self, data):
+        # 注释也是一个子节点
+        self.text_open = False
+        if self.h3_depth:
+            self.stack[-1].parts.append(data)
 
 
+def _folder_name(dt):
+    h3 = dt.first_h3
+    if h3 is _UNSET:
+        return None
+    return _node_string(h3)
 
-        # 构建当前书签的路径
-        path_segments = []
-        current_node = link.parent # 从 <A> 标签的父级开始向上回溯
 
-        while current_node:
-            if current_node.name == 'dl' and current_node.parent and current_node.parent.name == 'dt':
-                # 如果是 <DL><p><DT><H3>...</H3> 结构，则 H3 是文件夹名称
-                h3_tag = current_node.parent.find('h3')
-                if h3_tag and h3_tag.string:
-                    path_segments.insert(0, h3_tag.string.strip())
-            
-            # 检查是否有顶级的 H1 标签作为根目录的名称
-            if current_node.name == 'html': # 达到文档根目录
-                h1_tag = current_node.find('h1')
-                if h1_tag and h1_tag.string and h1_tag.string.strip() == "Bookmarks": # 假设顶级标题是 "Bookmarks"
-                    # 避免将 "Bookmarks" 加入路径，如果它是默认的根目录名
-                    pass
-            
-            current_node = current_node.parent
+def folder_names(path):
+    """文件夹路径中各层的名称（没有名称的层跳过）"""
+    names = []
+    for dt in path:
+        name = _folder_name(dt)
+        if name:
+            names.append(name.strip())
+    return tuple(names)
 
-        # 格式化路径，如果路径为空，表示在根目录
-        position = "根目录"
-        if path_segments:
-            position = " - ".join(path_segments)
 
-        # 添加行数信息
+def extract_urls_and_positions(file_path):
+    """
+    从 HTML 书签文件中提取网址及其在书签层级中的位置，以及所在行数。
+    行数是书签在所在文件夹中的序号（只统计直接属于该文件夹的书签）。
+    """
+    parser = BookmarkParser()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            parser.feed(data)
+    parser.close()
+
+    # 文件夹名称在整个文件读完后再取：<dt> 中的第一个 <h3> 可能出现在其 <dl> 之后
+    names = {}
+    urls_and_positions = []
+    for url, path, line_number in parser.links:
+        position = names.get(path)
+        if position is None:
+            path_segments = folder_names(path)
+            position = " - ".join(path_segments) if path_segments else "根目录"
+            names[path] = position
         urls_and_positions.append((url, position, line_number))
-            
+
     return urls_and_positions
 
-def find_duplicates(urls_and_positions):
+def build_index(urls_and_positions, rules=DEFAULT_RULES):
     """
-    查找重复的网址，并记录它们的出现次数和所有位置。
+    按规范键建立索引：规范键 -> {"count", "positions": [(位置, 行数)], "urls": [原始网址]}。
+    rules 为空时规范键就是原始网址（只合并完全相同的网址）。
     """
-    # 使用 defaultdict 存储每个 URL 的所有位置
-    url_info = defaultdict(lambda: {"count": 0, "positions": []})
+    url_info = defaultdict(lambda: {"count": 0, "positions": [], "urls": []})
+    canonical = {}   # 同一网址只规范化一次
 
     for url, position, line_number in urls_and_positions:
-        url_info[url]["count"] += 1
-        url_info[url]["positions"].append((position, line_number))
-    
+        key = canonical.get(url)
+        if key is None:
+            key = canonical[url] = canonical_url(url, rules) if rules else url
+        info = url_info[key]
+        info["count"] += 1
+        info["positions"].append((position, line_number))
+        info["urls"].append(url)
+
+    return url_info
+
+
+def find_duplicates(urls_and_positions, rules=DEFAULT_RULES, url_info=None):
+    """
+    查找重复的网址，并记录它们的出现次数和所有位置。
+    网址先经过规范化规则（http/https、末尾 /、www.、跟踪参数、片段等）再比较，
+    由规则合并的组在 "rules" 中记录是哪些规则使它们相同。
+    """
+    if url_info is None:
+        url_info = build_index(urls_and_positions, rules)
+
     # 筛选出重复的网址
-    duplicates = {url: info for url, info in url_info.items() if info["count"] > 1}
-    
+    duplicates = {key: info for key, info in url_info.items() if info["count"] > 1}
+    for info in duplicates.values():
+        info["rules"] = merged_by(info["urls"], rules) if len(set(info["urls"])) > 1 else []
+
     return duplicates
 
+
+def print_duplicates(duplicates):
+    if not duplicates:
+        print("没有发现重复的网址。")
+        return
+    duplicate_count = len(duplicates)
+    print(f"发现 {duplicate_count} 个重复网址：\n")
+    for info in duplicates.values():
+        first_url = info["urls"][0]
+        print(f"{first_url} —— 出现次数: {info['count']}")
+        if info["rules"]:
+            print(f"    合并规则: {'、'.join(info['rules'])}")
+        for i, ((position, line_number), url) in enumerate(zip(info['positions'], info['urls'])):
+            variant = f" 网址: {url}" if url != first_url else ""
+            print(f"    位置 {i + 1}: {position} 行数: {line_number}{variant}")
+
+
+def print_near_duplicates(url_info):
+    """近似重复：同一域名下路径相似的不同网址，只列出供人工确认，不计入重复"""
+    groups = find_near_duplicates(url_info.keys())
+    if not groups:
+        print("\n没有发现近似重复的网址。")
+        return
+    print(f"\n发现 {len(groups)} 组近似重复网址（同一域名、路径相似，需人工确认）：\n")
+    for keys, similarity in sorted(groups, key=lambda group: group[0][0]):
+        print(f"相似度 ≥ {similarity:.2f}")
+        for key in keys:
+            info = url_info[key]
+            position, line_number = info["positions"][0]
+            more = f"（共 {info['count']} 处）" if info["count"] > 1 else ""
+            print(f"    {info['urls'][0]}  位置: {position} 行数: {line_number}{more}")
+
+
+USAGE = """用法: python check_duplicates.py <bookmarks.html> [--rules 规则,规则,...|none] [--fuzzy]
+      python check_duplicates.py --merge <输出.html> <书签1.html> <书签2.html> ... [--rules ...]
+      python check_duplicates.py --check-links <bookmarks.html> [--no-cache]
+      python check_duplicates.py --diff <旧书签.html> <新书签.html>
+    --rules   比较前应用的规范化规则，默认全部：{rules}；none 表示只合并完全相同的网址
+    --fuzzy   另外列出近似重复（同一域名下路径相似）的网址
+    --merge   合并多个浏览器导出的书签文件：文件夹按路径合并，重复的书签只保留第一个
+    --check-links  检查书签能否访问，按文件夹列出失败的链接（结果缓存在 link_cache.db 中）
+    --no-cache     检查链接时不使用缓存
+    --diff    比较两个书签文件：新增、删除、移动、重命名的书签和文件夹"""
+
+
 def main():
-    if len(sys.argv) != 2:
-        print("用法: python check_duplicates.py <bookmarks.html>")
+    args = sys.argv[1:]
+    rules = DEFAULT_RULES
+    fuzzy = False
+    merge_output = None
+    check_links_mode = False
+    use_cache = True
+    diff_mode = False
+    files = []
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == "--rules" and args:
+                rules = parse_rules(args.pop(0))
+            elif arg == "--fuzzy":
+                fuzzy = True
+            elif arg == "--merge" and args:
+                merge_output = args.pop(0)
+            elif arg == "--check-links":
+                check_links_mode = True
+            elif arg == "--no-cache":
+                use_cache = False
+            elif arg == "--diff":
+                diff_mode = True
+            else:
+                files.append(arg)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    expected = 2 if diff_mode else 1
+    if not files or (merge_output is None and len(files) != expected):
+        print(USAGE.format(rules=",".join(DEFAULT_RULES)))
         sys.exit(1)
 
-    file_path = sys.argv[1]
+    file_path = files[0]
     try:
+        if merge_output is not None:
+            from merge import merge_files, print_merge_stats
+            stats, written = merge_files(files, merge_output, rules)
+            print_merge_stats(stats, written, merge_output)
+            return
+        if diff_mode:
+            from diff import diff_files, print_diff
+            print_diff(diff_files(files[0], files[1]), files[0], files[1])
+            return
+
         urls_and_positions = extract_urls_and_positions(file_path)
-        duplicates = find_duplicates(urls_and_positions)
+        if check_links_mode:
+            from linkcheck import CACHE_FILE, check_links, print_link_report
+            results, cached = check_links([url for url, _, _ in urls_and_positions],
+                                          cache_path=CACHE_FILE if use_cache else None)
+            print_link_report(urls_and_positions, results, cached)
+            return
 
-        if not duplicates:
-            print("没有发现重复的网址。")
-        else:
-            duplicate_count = len(duplicates)
-            print(f"发现 {duplicate_count} 个重复网址：\n")
-            for url, info in duplicates.items():
-                print(f"{url} —— 出现次数: {info['count']}")
-                for i, (position, line_number) in enumerate(info['positions']):
-                    print(f"    位置 {i + 1}: {position} 行数: {line_number}")
-
-    except FileNotFoundError:
-        print(f"错误：文件 '{file_path}' 未找到。请确保文件路径正确。")
+        url_info = build_index(urls_and_positions, rules)
+        print_duplicates(find_duplicates(urls_and_positions, rules, url_info))
+        if fuzzy:
+            print_near_duplicates(url_info)
+
+    except FileNotFoundError as e:
+        print(f"错误：文件 '{e.filename or file_path}' 未找到。请确保文件路径正确。")
     except Exception as e:
         print(f"发生错误: {e}")
 
 if __name__ == "__main__":
     main()
- 
\ No newline at end of file
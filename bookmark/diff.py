@@ -0,0 +1,285 @@
+import hashlib
+from collections import defaultdict
+
+from merge import read_export
+
+# 两个书签导出文件的结构比较：
+# - 每个文件夹自底向上计算内容哈希（子书签的网址和标题、子文件夹的名称和内容哈希，与顺序无关），
+#   比较时两边同一路径的文件夹哈希相同就整棵跳过，只深入有变化的文件夹
+# - 只在一边出现的文件夹：同一父文件夹下名称不同、书签大部分相同的视为重命名，再比较其内容；
+#   其余的按内容哈希配对，内容相同、位置不同的是移动的文件夹
+# - 剩下的书签按网址配对：只在一边出现的是新增/删除，两边都有但文件夹不同的是移动，同一文件夹标题不同的是重命名
+# 同一父文件夹下同名的文件夹按路径合并（与 --merge 相同）。
+
+RENAME_SIMILARITY = 0.5   # 重命名（内容有变化）的文件夹：两边书签网址的 Jaccard 相似度下限
+
+
+class FolderNode:
+    __slots__ = ("name", "folders", "links", "digest", "count")
+
+    def __init__(self, name):
+        self.name = name
+        self.folders = {}   # 名称 -> FolderNode，按第一次出现的顺序
+        self.links = []     # (网址, 标题)
+        self.digest = None
+        self.count = 0      # 子树中的书签数量
+
+
+class TreeBuilder:
+    """作为 ExportReader 的接收方，按文件夹路径建立树"""
+
+    def __init__(self):
+        self.root = FolderNode("")
+
+    def _node(self, names):
+        node = self.root
+        for name in names:
+            child = node.folders.get(name)
+            if child is None:
+                child = node.folders[name] = FolderNode(name)
+            node = child
+        return node
+
+    def folder(self, source, names, attrs=None):
+        self._node(names)
+
+    def link(self, source, names, url, title, attrs):
+        self._node(names).links.append((url, title))
+
+
+def _seal(node):
+    """自底向上计算内容哈希（不含文件夹自身的名称，重命名后哈希不变）"""
+    lines = [f"L\0{url}\0{title}\n" for url, title in node.links]
+    node.count = len(node.links)
+    for child in node.folders.values():
+        _seal(child)
+        lines.append(f"F\0{child.name}\0{child.digest}\n")
+        node.count += child.count
+    lines.sort()
+    node.digest = hashlib.sha1("".join(lines).encode("utf-8")).hexdigest()
+
+
+def load_tree(file_path):
+    builder = TreeBuilder()
+    read_export(file_path, builder)
+    _seal(builder.root)
+    return builder.root
+
+
+def _walk(node, path):
+    """node 及其所有子文件夹：(路径, 节点)，父文件夹在前"""
+    stack = [(path, node)]
+    while stack:
+        path, node = stack.pop()
+        yield path, node
+        for name, child in reversed(list(node.folders.items())):
+            stack.append((path + (name,), child))
+
+
+def _url_similarity(a, b):
+    urls_a = {url for _, node in _walk(a, ()) for url, _ in node.links}
+    urls_b = {url for _, node in _walk(b, ()) for url, _ in node.links}
+    if not urls_a and not urls_b:
+        return 0.0
+    return len(urls_a & urls_b) / len(urls_a | urls_b)
+
+
+class TreeDiff:
+    def __init__(self):
+        self.skipped = 0                   # 内容相同、直接跳过的文件夹子树
+        self.added_links = []              # (路径, 网址, 标题)
+        self.removed_links = []
+        self.moved_links = []              # (网址, 原路径, 新路径, 原标题, 新标题)
+        self.renamed_links = []            # (路径, 网址, 原标题, 新标题)
+        self.added_folders = []            # (路径, 书签数)
+        self.removed_folders = []
+        self.moved_folders = []            # (原路径, 新路径, 书签数)
+        self.renamed_folders = []          # (原路径, 新路径, 书签数)
+        self._removed_subtrees = []        # 只在旧文件中出现的文件夹 (路径, 节点)
+        self._added_subtrees = []
+
+    def compare_folder(self, old, new, old_path, new_path):
+        if old.digest == new.digest:
+            self.skipped += 1
+            return
+
+        # 同一文件夹中的书签：按网址配对，标题不同的是重命名
+        old_titles = defaultdict(list)
+        for url, title in old.links:
+            old_titles[url].append(title)
+        for url, title in new.links:
+            titles = old_titles.get(url)
+            if titles:
+                old_title = titles.pop(0)
+                if old_title != title:
+                    self.renamed_links.append((new_path, url, old_title, title))
+            else:
+                self.added_links.append((new_path, url, title))
+        for url, titles in old_titles.items():
+            for title in titles:
+                self.removed_links.append((old_path, url, title))
+
+        for name, child in old.folders.items():
+            other = new.folders.get(name)
+            if other is None:
+                self._removed_subtrees.append((old_path + (name,), child))
+            else:
+                self.compare_folder(child, other, old_path + (name,), new_path + (name,))
+        for name, child in new.folders.items():
+            if name not in old.folders:
+                self._added_subtrees.append((new_path + (name,), child))
+
+    def match_folders(self):
+        """为只在一边出现的文件夹配对，配对不上的文件夹中的书签留给按网址配对"""
+        while self._removed_subtrees or self._added_subtrees:
+            removed, self._removed_subtrees = self._removed_subtrees, []
+            added, self._added_subtrees = self._added_subtrees, []
+            self._match_subtrees(removed, added)
+
+    def _match_subtrees(self, removed, added):
+        removed = [(path, node) for top_path, top in removed for path, node in _walk(top, top_path)]
+        added = [(path, node) for top_path, top in added for path, node in _walk(top, top_path)]
+        matched_removed, matched_added = set(), set()
+
+        def covered(path, matched):
+            return any(path[:i] in matched for i in range(1, len(path) + 1))
+
+        # 1. 同一父文件夹下名称不同、书签大部分相同（包括完全相同）：重命名，再比较内容
+        remaining_added = defaultdict(list)
+        for path, node in added:
+            if not covered(path, matched_added):
+                remaining_added[path[:-1]].append((path, node))
+        for path, node in removed:
+            if covered(path, matched_removed):
+                continue
+            best, best_similarity = None, RENAME_SIMILARITY
+            for other_path, other in remaining_added.get(path[:-1], ()):
+                if covered(other_path, matched_added):
+                    continue
+                similarity = _url_similarity(node, other)
+                if similarity >= best_similarity:
+                    best, best_similarity = (other_path, other), similarity
+            if best is None:
+                continue
+            other_path, other = best
+            matched_removed.add(path)
+            matched_added.add(other_path)
+            self.renamed_folders.append((path, other_path, other.count))
+            self.compare_folder(node, other, path, other_path)
+
+        # 2. 内容完全相同：移动和/或重命名（空文件夹无法判断，不参与）
+        by_digest = defaultdict(list)
+        for path, node in added:
+            if node.count:
+                by_digest[node.digest].append((path, node))
+        for path, node in removed:
+            if not node.count or covered(path, matched_removed):
+                continue
+            candidates = [(other_path, other) for other_path, other in by_digest.get(node.digest, ())
+                          if not covered(other_path, matched_added)]
+            if not candidates:
+                continue
+            # 优先选择同名或同一父文件夹的
+            other_path, other = min(candidates, key=lambda item: (item[0][-1] != path[-1], item[0][:-1] != path[:-1]))
+            by_digest[node.digest].remove((other_path, other))
+            matched_removed.add(path)
+            matched_added.add(other_path)
+            self._record_folder_change(path, other_path, node.count)
+            self.skipped += 1
+
+        # 3. 配对不上的：文件夹记为新增/删除，其中直接包含的书签留给按网址配对
+        removed_paths = {path for path, _ in removed}
+        for path, node in removed:
+            if covered(path, matched_removed):
+                continue
+            if path[:-1] not in removed_paths:
+                self.removed_folders.append((path, node.count))
+            self.removed_links.extend((path, url, title) for url, title in node.links)
+        added_paths = {path for path, _ in added}
+        for path, node in added:
+            if covered(path, matched_added):
+                continue
+            if path[:-1] not in added_paths:
+                self.added_folders.append((path, node.count))
+            self.added_links.extend((path, url, title) for url, title in node.links)
+
+    def _record_folder_change(self, old_path, new_path, count):
+        if old_path[:-1] == new_path[:-1]:
+            self.renamed_folders.append((old_path, new_path, count))
+        else:
+            self.moved_folders.append((old_path, new_path, count))
+
+    def match_links(self):
+        """不同文件夹中网址相同的书签是移动的书签"""
+        removed_by_url = defaultdict(list)
+        for path, url, title in self.removed_links:
+            removed_by_url[url].append((path, title))
+        added = []
+        for path, url, title in self.added_links:
+            candidates = removed_by_url.get(url)
+            if candidates:
+                old_path, old_title = candidates.pop(0)
+                self.moved_links.append((url, old_path, path, old_title, title))
+            else:
+                added.append((path, url, title))
+        self.added_links = added
+        self.removed_links = [(path, url, title) for url, items in removed_by_url.items() for path, title in items]
+
+
+def diff_files(old_path, new_path):
+    """比较两个书签导出文件，返回 TreeDiff"""
+    old_root = load_tree(old_path)
+    new_root = load_tree(new_path)
+    diff = TreeDiff()
+    diff.compare_folder(old_root, new_root, (), ())
+    diff.match_folders()
+    diff.match_links()
+    return diff
+
+
+def _format_path(path):
+    return " - ".join(path) if path else "根目录"
+
+
+def print_diff(diff, old_file, new_file):
+    print(f"比较 {old_file} -> {new_file}")
+    print(f"书签：新增 {len(diff.added_links)} 个，删除 {len(diff.removed_links)} 个，"
+          f"移动 {len(diff.moved_links)} 个，重命名 {len(diff.renamed_links)} 个")
+    print(f"文件夹：新增 {len(diff.added_folders)} 个，删除 {len(diff.removed_folders)} 个，"
+          f"移动 {len(diff.moved_folders)} 个，重命名 {len(diff.renamed_folders)} 个")
+    print(f"（内容相同而跳过的文件夹 {diff.skipped} 个）")
+
+    if diff.added_folders:
+        print("\n[新增文件夹]")
+        for path, count in diff.added_folders:
+            print(f"    {_format_path(path)}（{count} 个书签）")
+    if diff.removed_folders:
+        print("\n[删除文件夹]")
+        for path, count in diff.removed_folders:
+            print(f"    {_format_path(path)}（{count} 个书签）")
+    if diff.moved_folders:
+        print("\n[移动文件夹]")
+        for old_path, new_path, count in diff.moved_folders:
+            print(f"    {_format_path(old_path)} -> {_format_path(new_path)}（{count} 个书签）")
+    if diff.renamed_folders:
+        print("\n[重命名文件夹]")
+        for old_path, new_path, count in diff.renamed_folders:
+            print(f"    {_format_path(old_path)} -> {new_path[-1]}（{count} 个书签）")
+
+    if diff.added_links:
+        print("\n[新增书签]")
+        for path, url, title in diff.added_links:
+            print(f"    {_format_path(path)}: {title}  {url}")
+    if diff.removed_links:
+        print("\n[删除书签]")
+        for path, url, title in diff.removed_links:
+            print(f"    {_format_path(path)}: {title}  {url}")
+    if diff.moved_links:
+        print("\n[移动书签]")
+        for url, old_path, new_path, old_title, new_title in diff.moved_links:
+            renamed = f"，标题 \"{old_title}\" -> \"{new_title}\"" if old_title != new_title else ""
+            print(f"    {new_title}  {url}\n        {_format_path(old_path)} -> {_format_path(new_path)}{renamed}")
+    if diff.renamed_links:
+        print("\n[重命名书签]")
+        for path, url, old_title, new_title in diff.renamed_links:
+            print(f"    {_format_path(path)}: \"{old_title}\" -> \"{new_title}\"  {url}")
@@ -0,0 +1,279 @@
+import asyncio
+import os
+import sqlite3
+import ssl
+import time
+from collections import defaultdict
+from urllib.parse import urljoin, urlsplit
+
+# 书签链接检查：asyncio + 标准库实现的 HTTP/1.1 客户端，不依赖第三方库。
+# - 每个 (协议, 主机, 端口) 一个连接池，HEAD 请求的连接保持长连接复用
+# - 先发 HEAD，失败（>= 400）时改用 GET 再试一次（不少网站不支持 HEAD）
+# - 每个主机同时最多 PER_HOST_LIMIT 个请求，总并发 TOTAL_LIMIT；先排主机的队，轮到后才占用总并发名额，
+#   同一主机排队的请求不会占满总并发而挡住其他主机
+# - 结果缓存在 SQLite 中，有效期内的网址不再检查（失败结果有效期更短）
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "link_cache.db")
+TIMEOUT = 15.0           # 每次请求（连接 + 读取响应头）的超时秒数
+PER_HOST_LIMIT = 4
+TOTAL_LIMIT = 64
+MAX_REDIRECTS = 5
+OK_TTL = 7 * 24 * 3600   # 可访问的网址多久之后重新检查
+FAILURE_TTL = 3600       # 失败的网址多久之后重新检查
+MAX_HEADER_SIZE = 64 * 1024
+USER_AGENT = "Mozilla/5.0 (compatible; bookmark-link-check)"
+
+
+class LinkCache:
+    """检查结果缓存：网址 -> (状态码, 错误, 检查时间)"""
+
+    def __init__(self, db_path, ok_ttl=OK_TTL, failure_ttl=FAILURE_TTL):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS link_status (url TEXT PRIMARY KEY, status INTEGER, error TEXT, checked REAL)"
+        )
+        self.ok_ttl = ok_ttl
+        self.failure_ttl = failure_ttl
+
+    def get(self, url, now):
+        row = self.conn.execute("SELECT status, error, checked FROM link_status WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        status, error, checked = row
+        ttl = self.ok_ttl if is_ok(status, error) else self.failure_ttl
+        return (status, error) if now - checked < ttl else None
+
+    def put(self, url, status, error, now):
+        self.conn.execute("INSERT OR REPLACE INTO link_status (url, status, error, checked) VALUES (?, ?, ?, ?)",
+                          (url, status, error, now))
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def is_ok(status, error):
+    return error is None and status is not None and status < 400
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class HostPool:
+    """一个主机的连接池：限制同时进行的请求数，空闲的长连接留给下一个请求"""
+
+    def __init__(self, scheme, host, port, limit, ssl_context):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.semaphore = asyncio.Semaphore(limit)
+        self.idle = []
+        self.ssl_context = ssl_context if scheme == "https" else None
+
+    async def connect(self):
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context, limit=MAX_HEADER_SIZE,
+            server_hostname=self.host if self.ssl_context else None,
+        )
+        return _Connection(reader, writer)
+
+    def take_idle(self):
+        while self.idle:
+            connection = self.idle.pop()
+            if not connection.writer.is_closing() and not connection.reader.at_eof():
+                return connection
+            connection.close()
+        return None
+
+    def release(self, connection, reusable):
+        if reusable:
+            self.idle.append(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        for connection in self.idle:
+            connection.close()
+        self.idle.clear()
+
+
+class LinkChecker:
+    def __init__(self, timeout=TIMEOUT, per_host=PER_HOST_LIMIT, total=TOTAL_LIMIT):
+        self.timeout = timeout
+        self.per_host = per_host
+        self.total = asyncio.Semaphore(total)
+        self.pools = {}
+        self.ssl_context = ssl.create_default_context()
+
+    def _pool(self, scheme, host, port):
+        key = (scheme, host, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = HostPool(scheme, host, port, self.per_host, self.ssl_context)
+        return pool
+
+    async def _send(self, connection, method, target, host_header):
+        request = (f"{method} {target} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: {USER_AGENT}\r\n"
+                   f"Accept: */*\r\nConnection: keep-alive\r\n\r\n")
+        connection.writer.write(request.encode("latin-1", "replace"))
+        await connection.writer.drain()
+        head = await connection.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        version, status = lines[0].split(" ", 2)[:2]
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        # HEAD 没有响应体，连接可以复用；GET 不读取响应体，直接关闭连接
+        reusable = (method == "HEAD" and version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close")
+        return int(status), headers, reusable
+
+    async def request(self, method, url):
+        """发送一次请求，返回 (状态码, 响应头)；复用的空闲连接已被服务器关闭时换新连接重试一次"""
+        split = urlsplit(url)
+        scheme = split.scheme.lower()
+        port = split.port or (443 if scheme == "https" else 80)
+        pool = self._pool(scheme, split.hostname, port)
+        target = split.path or "/"
+        if split.query:
+            target += "?" + split.query
+        host_header = split.hostname if split.port is None else f"{split.hostname}:{split.port}"
+
+        async with pool.semaphore, self.total:
+            connection = pool.take_idle()
+            if connection is not None:
+                try:
+                    status, headers, reusable = await asyncio.wait_for(
+                        self._send(connection, method, target, host_header), self.timeout)
+                    pool.release(connection, reusable)
+                    return status, headers
+                except asyncio.TimeoutError:
+                    connection.close()   # 服务器响应慢，不是连接失效，不再重试
+                    raise
+                except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                    connection.close()
+
+            connection = None
+            try:
+                connection = await asyncio.wait_for(pool.connect(), self.timeout)
+                status, headers, reusable = await asyncio.wait_for(
+                    self._send(connection, method, target, host_header), self.timeout)
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                raise
+            pool.release(connection, reusable)
+            return status, headers
+
+    async def _follow(self, method, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers = await self.request(method, url)
+            location = headers.get("location")
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                if urlsplit(url).scheme.lower() not in ("http", "https"):
+                    return status
+                continue
+            return status
+        raise ValueError("重定向次数过多")
+
+    async def check(self, url):
+        """检查一个网址，返回 (状态码, 错误说明)；可以访问时错误说明为 None"""
+        try:
+            status = await self._follow("HEAD", url)
+            if status >= 400:
+                status = await self._follow("GET", url)
+            return status, None
+        except asyncio.TimeoutError:
+            return None, "超时"
+        except ssl.SSLError as e:
+            return None, f"SSL 错误：{e.reason or e}"
+        except asyncio.IncompleteReadError:
+            return None, "连接被关闭"
+        except asyncio.LimitOverrunError:
+            return None, "响应头过大"
+        except (OSError, ValueError, UnicodeError) as e:
+            return None, str(e) or type(e).__name__
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+
+def checkable(url):
+    split = urlsplit(url)
+    return split.scheme.lower() in ("http", "https") and bool(split.hostname)
+
+
+async def _check_all(urls, results, cache, timeout, per_host, total):
+    checker = LinkChecker(timeout, per_host, total)
+    done = 0
+
+    async def check_one(url):
+        nonlocal done
+        status, error = await checker.check(url)
+        results[url] = (status, error)
+        if cache is not None:
+            cache.put(url, status, error, time.time())
+        done += 1
+        if done % 50 == 0 or done == len(urls):
+            print(f"\r已检查 {done}/{len(urls)}", end="", flush=True)
+
+    try:
+        await asyncio.gather(*(check_one(url) for url in urls))
+    finally:
+        checker.close()
+    if urls:
+        print()
+
+
+def check_links(urls, cache_path=CACHE_FILE, timeout=TIMEOUT, per_host=PER_HOST_LIMIT, total=TOTAL_LIMIT):
+    """
+    检查一组网址，返回 ({网址: (状态码, 错误说明)}, 缓存命中数)。
+    不是 http/https 的网址不检查；cache_path 为 None 时不使用缓存。
+    """
+    urls = [url for url in dict.fromkeys(urls) if checkable(url)]
+    cache = LinkCache(cache_path) if cache_path else None
+    results = {}
+    pending = []
+    now = time.time()
+    for url in urls:
+        cached = cache.get(url, now) if cache is not None else None
+        if cached is None:
+            pending.append(url)
+        else:
+            results[url] = cached
+    try:
+        asyncio.run(_check_all(pending, results, cache, timeout, per_host, total))
+    finally:
+        if cache is not None:
+            cache.close()
+    return results, len(urls) - len(pending)
+
+
+def print_link_report(urls_and_positions, results, cached):
+    """按书签所在文件夹列出无法访问的链接"""
+    failures = defaultdict(list)
+    failed_urls = set()
+    for url, position, line_number in urls_and_positions:
+        result = results.get(url)
+        if result is None or is_ok(*result):
+            continue
+        status, error = result
+        failures[position].append((error or str(status), url, line_number))
+        failed_urls.add(url)
+
+    print(f"检查了 {len(results)} 个网址（其中 {cached} 个使用缓存结果），无法访问 {len(failed_urls)} 个")
+    for position in sorted(failures):
+        print(f"\n[{position}]")
+        for reason, url, line_number in failures[position]:
+            print(f"    {reason}  {url} 行数: {line_number}")
+
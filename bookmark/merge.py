@@ -0,0 +1,209 @@
+import heapq
+import html
+import json
+import sqlite3
+
+from canonical import DEFAULT_RULES, canonical_url
+from check_duplicates import READ_SIZE, BookmarkParser, folder_names
+
+# 合并多个 Netscape 格式的书签导出文件：
+# - 文件夹按路径（各层名称）合并，子项按第一次出现的顺序排列
+# - 书签按规范化后的网址去重，保留最先出现的一个（网址、标题和 ADD_DATE、ICON 等属性；<DD> 描述不保留）
+# - 去重后子树中没有任何书签的文件夹（包括原本就是空的文件夹）不写出
+# - 中间数据放在 SQLite 临时数据库中（磁盘上，关闭后自动删除），内存占用与书签数量无关；
+#   输出时按文件夹逐层查询，边查询边写入
+
+HEADER = """<!DOCTYPE NETSCAPE-Bookmark-file-1>
+<!-- This is an automatically generated file.
+     It will be read and overwritten.
+     DO NOT EDIT! -->
+<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">
+<TITLE>Bookmarks</TITLE>
+<H1>Bookmarks</H1>
+<DL><p>
+"""
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class ExportReader(BookmarkParser):
+    """
+    读取一个导出文件，把每个文件夹和每个书签（网址、标题、属性、文件夹路径）交给 merger：
+    merger.folder(source, 文件夹路径, 属性) 和 merger.link(source, 文件夹路径, 网址, 标题, 属性)
+    """
+
+    def __init__(self, merger, source):
+        super().__init__()
+        self.merger = merger
+        self.source = source
+        self.h3_attrs = {}     # <h3> 节点 -> 属性（ADD_DATE、PERSONAL_TOOLBAR_FOLDER 等）
+        self.current = None    # 正在读取标题的书签：[网址, 属性, 文件夹路径, 标题片段]
+
+    def handle_starttag(self, tag, attrs, close_void=True):
+        if tag in ('a', 'dt', 'dd', 'dl', 'h3'):
+            self._finish_link()
+        depth = len(self.dl.path) if self.dl is not None else 0
+        super().handle_starttag(tag, attrs, close_void)
+        if tag == 'h3':
+            self.h3_attrs[self.stack[-1]] = dict(attrs)
+        elif tag == 'dl' and len(self.dl.path) > depth:
+            # 新的一层文件夹：先登记，属性和位置以第一次出现时为准（去重后为空的文件夹在写出时跳过）
+            dt = self.dl.path[-1]
+            self.merger.folder(self.source, folder_names(self.dl.path), self.h3_attrs.get(dt.first_h3))
+
+    def add_link(self, href, attrs, path, line_number):
+        self.current = [href, attrs, folder_names(path), []]
+
+    def handle_endtag(self, tag):
+        if tag in ('a', 'dl'):
+            self._finish_link()
+        super().handle_endtag(tag)
+
+    def handle_data(self, data):
+        super().handle_data(data)
+        if self.current is not None:
+            self.current[3].append(data)
+
+    def close(self):
+        super().close()
+        self._finish_link()
+
+    def _finish_link(self):
+        if self.current is not None:
+            href, attrs, names, title = self.current
+            self.current = None
+            self.merger.link(self.source, names, href, "".join(title).strip(), attrs)
+
+
+def read_export(file_path, merger, source=0):
+    reader = ExportReader(merger, source)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            reader.feed(data)
+    reader.close()
+
+
+class BookmarkMerger:
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = rules
+        self.conn = sqlite3.connect("")   # 空文件名：SQLite 私有临时数据库，关闭时自动删除
+        self.conn.executescript(
+            "CREATE TABLE folders (id INTEGER PRIMARY KEY, parent INTEGER, name TEXT, attrs TEXT, seq INTEGER);"
+            "CREATE TABLE entries (folder INTEGER, seq INTEGER, url TEXT, title TEXT, attrs TEXT);"
+            "CREATE TABLE seen (key TEXT PRIMARY KEY, source INTEGER) WITHOUT ROWID;"
+        )
+        self.folder_ids = {(): 0}
+        self.seq = 0
+        self.stats = []
+
+    def _next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def folder(self, source, names, attrs=None):
+        """返回文件夹路径对应的 id，不存在时逐层创建；属性取第一次出现时的"""
+        folder_id = self.folder_ids.get(names)
+        if folder_id is None:
+            parent = self.folder(source, names[:-1])
+            cursor = self.conn.execute(
+                "INSERT INTO folders (parent, name, attrs, seq) VALUES (?, ?, ?, ?)",
+                (parent, names[-1], json.dumps(attrs or {}), self._next_seq()),
+            )
+            folder_id = self.folder_ids[names] = cursor.lastrowid
+            self.stats[source]["folders"] += 1
+        return folder_id
+
+    def link(self, source, names, url, title, attrs):
+        stats = self.stats[source]
+        stats["total"] += 1
+        key = canonical_url(url, self.rules) if self.rules else url
+        cursor = self.conn.execute("INSERT OR IGNORE INTO seen (key, source) VALUES (?, ?)", (key, source))
+        if cursor.rowcount == 0:
+            first_source = self.conn.execute("SELECT source FROM seen WHERE key = ?", (key,)).fetchone()[0]
+            stats["duplicate_self" if first_source == source else "duplicate_earlier"] += 1
+            return
+        attrs = {name: value for name, value in attrs.items() if name != 'href'}
+        self.conn.execute(
+            "INSERT INTO entries (folder, seq, url, title, attrs) VALUES (?, ?, ?, ?, ?)",
+            (self.folder(source, names), self._next_seq(), url, title, json.dumps(attrs)),
+        )
+        stats["added"] += 1
+
+    def add_file(self, file_path):
+        """读入一个导出文件，返回该文件的统计"""
+        source = len(self.stats)
+        self.stats.append({"file": file_path, "total": 0, "added": 0, "duplicate_earlier": 0,
+                           "duplicate_self": 0, "folders": 0})
+        read_export(file_path, self, source)
+        self.conn.commit()
+        return self.stats[source]
+
+    def write(self, output_path):
+        """按文件夹逐层写出合并结果，返回写出的书签数量"""
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_folder ON entries (folder, seq)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent, seq)")
+        # 子树中有书签的文件夹：直接包含书签的文件夹及其所有上级
+        self.conn.execute("DROP TABLE IF EXISTS nonempty")
+        self.conn.execute(
+            "CREATE TEMP TABLE nonempty AS WITH RECURSIVE up(id) AS ("
+            "SELECT folder FROM entries UNION SELECT folders.parent FROM folders JOIN up ON folders.id = up.id"
+            ") SELECT id FROM up"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS nonempty_id ON nonempty (id)")
+        with open(output_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as out:
+            out.write(HEADER)
+            count = self._write_folder(out, 0, "    ")
+            out.write("</DL><p>\n")
+        return count
+
+    def _write_folder(self, out, folder_id, indent):
+        folders = self.conn.execute(
+            "SELECT seq, id, name, NULL, attrs FROM folders WHERE parent = ? AND id IN (SELECT id FROM nonempty) "
+            "ORDER BY seq", (folder_id,)
+        ).fetchall()
+        entries = self.conn.execute(
+            "SELECT seq, NULL, url, title, attrs FROM entries WHERE folder = ? ORDER BY seq", (folder_id,)
+        )
+        count = 0
+        # 子文件夹和书签按第一次出现的顺序交错输出
+        for _, child_id, text, title, attrs in heapq.merge(folders, entries):
+            attrs = _format_attrs(json.loads(attrs))
+            if child_id is not None:
+                out.write(f"{indent}<DT><H3{attrs}>{html.escape(text, quote=False)}</H3>\n{indent}<DL><p>\n")
+                count += self._write_folder(out, child_id, indent + "    ")
+                out.write(f"{indent}</DL><p>\n")
+            else:
+                url = text
+                out.write(f'{indent}<DT><A HREF="{html.escape(url)}"{attrs}>{html.escape(title, quote=False)}</A>\n')
+                count += 1
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+def _format_attrs(attrs):
+    return "".join(f' {name.upper()}="{html.escape(value or "")}"' for name, value in attrs.items())
+
+
+def merge_files(input_paths, output_path, rules=DEFAULT_RULES):
+    """合并多个书签导出文件到 output_path，返回 (各输入文件的统计, 写出的书签数量)"""
+    merger = BookmarkMerger(rules)
+    try:
+        for path in input_paths:
+            merger.add_file(path)
+        written = merger.write(output_path)
+        return merger.stats, written
+    finally:
+        merger.close()
+
+
+def print_merge_stats(stats, written, output_path):
+    print(f"合并完成：{output_path}，共 {written} 个书签\n")
+    for i, item in enumerate(stats, 1):
+        print(f"输入 {i}: {item['file']}")
+        print(f"    书签 {item['total']} 个，新增 {item['added']} 个，"
+              f"与之前的文件重复 {item['duplicate_earlier']} 个，文件内重复 {item['duplicate_self']} 个，"
+              f"新建文件夹 {item['folders']} 个")
@@ -0,0 +1,136 @@
+"""
+链接检查的离线测试：在本机启动桩 HTTP 服务器，不访问外网。
+运行：python test_linkcheck.py（也可以用 pytest）
+"""
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from linkcheck import LinkChecker, check_links, is_ok
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # 支持长连接，HEAD 请求的连接会被复用
+    delay = 0.0
+
+    def _respond(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _route(self, method):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.path.startswith("/ok"):
+            self._respond(200)
+        elif self.path == "/missing":
+            self._respond(404)
+        elif self.path == "/no-head":
+            self._respond(405 if method == "HEAD" else 200)
+        elif self.path == "/redirect":
+            self._respond(301, [("Location", "/ok")])
+        elif self.path == "/loop":
+            self._respond(302, [("Location", "/loop")])
+        elif self.path == "/slow":
+            time.sleep(1.0)
+            self._respond(200)
+        else:
+            self._respond(500)
+
+    def do_HEAD(self):
+        self._route("HEAD")
+
+    def do_GET(self):
+        self._route("GET")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(delay=0.0):
+    handler = type("Handler", (StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LinkCheckTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_statuses(self):
+        urls = {
+            "/ok": True, "/missing": False, "/no-head": True,
+            "/redirect": True, "/loop": False, "/slow": False,
+        }
+        refused = f"http://127.0.0.1:{closed_port()}/"
+        results, cached = check_links([self.base + path for path in urls] + [refused], cache_path=None, timeout=0.5)
+        self.assertEqual(cached, 0)
+        for path, expected in urls.items():
+            self.assertEqual(is_ok(*results[self.base + path]), expected, path)
+        self.assertEqual(results[self.base + "/slow"], (None, "超时"))
+        self.assertEqual(results[self.base + "/missing"][0], 404)
+        self.assertFalse(is_ok(*results[refused]))
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "cache.db")
+            urls = [self.base + "/ok", self.base + "/missing"]
+            first, cached = check_links(urls, cache_path=cache_path)
+            self.assertEqual(cached, 0)
+            second, cached = check_links(urls, cache_path=cache_path)
+            self.assertEqual(cached, 2)
+            self.assertEqual(first, second)
+
+    def test_slow_host_does_not_block_others(self):
+        """同一主机排队的请求不占用总并发名额，其他主机的请求不必等它们"""
+        slow_server, slow_base = start_server(delay=0.3)
+        try:
+            async def run():
+                checker = LinkChecker(timeout=5.0, per_host=4, total=8)
+                started = time.perf_counter()
+                finished = {}
+
+                async def check(url):
+                    await checker.check(url)
+                    finished[url] = time.perf_counter() - started
+
+                fast_urls = [f"{self.base}/ok{i}" for i in range(5)]
+                slow_urls = [f"{slow_base}/ok{i}" for i in range(40)]
+                try:
+                    await asyncio.gather(*(check(url) for url in slow_urls + fast_urls))
+                finally:
+                    checker.close()
+                return max(finished[url] for url in fast_urls), max(finished.values())
+
+            fast_done, all_done = asyncio.run(run())
+            # 慢主机每批 4 个、每个 0.3 秒，全部完成约 3 秒；快主机的请求应该在第一批就完成
+            self.assertLess(fast_done, 1.0)
+            self.assertGreater(all_done, 2.5)
+        finally:
+            slow_server.shutdown()
+            slow_server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import errno
+import os
+import shutil
+import sys
+
+# 复制/移动的快速路径：
+# - 移动：源文件和目标目录在同一设备上时直接 os.rename（原子操作，不读写数据）
+# - 复制：依次尝试 reflink（写时复制克隆）、copy_file_range、sendfile，数据都在内核中完成复制，
+#   都不可用时才退回普通的读写复制。复制后保留时间戳和权限，并核对文件大小。
+
+FICLONE = 0x40049409          # Linux 的 FICLONE ioctl（Btrfs、XFS、bcachefs 等支持）
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# 这些错误表示当前方式不可用（跨文件系统、内核或文件系统不支持等），换下一种方式
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                    errno.EBADF, errno.ETXTBSY, errno.EPERM}
+
+# 统计输出时各方式的名称
+METHOD_NAMES = {
+    "rename": "同盘重命名",
+    "reflink": "reflink 克隆",
+    "copy_file_range": "copy_file_range",
+    "sendfile": "sendfile",
+    "stream": "普通读写复制",
+}
+
+
+def _reflink(src_fd, dst_fd, size):
+    import fcntl
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK_SIZE, size - offset), offset, offset)
+        if not copied:
+            break
+        offset += copied
+
+
+def _sendfile(src_fd, dst_fd, size):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, min(COPY_CHUNK_SIZE, size - offset))
+        if not sent:
+            break
+        offset += sent
+
+
+def _stream(src_fd, dst_fd, size):
+    with open(src_fd, "rb", closefd=False) as src, open(dst_fd, "wb", closefd=False) as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def _available_methods():
+    methods = []
+    if sys.platform.startswith("linux"):
+        # FICLONE 和文件到文件的 sendfile 都只有 Linux 支持
+        methods.append(("reflink", _reflink))
+        if hasattr(os, "copy_file_range"):
+            methods.append(("copy_file_range", _copy_file_range))
+        methods.append(("sendfile", _sendfile))
+    methods.append(("stream", _stream))
+    return methods
+
+
+_METHODS = _available_methods()
+
+
+def copy_file(source, target):
+    """复制文件并保留元数据，返回实际使用的方式；复制后大小不一致时删除目标并抛出 OSError"""
+    size = os.path.getsize(source)
+    used = None
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        for name, method in _METHODS:
+            try:
+                method(src.fileno(), dst.fileno(), size)
+                used = name
+                break
+            except OSError as e:
+                if name == "stream" or e.errno not in _FALLBACK_ERRNOS:
+                    dst.close()
+                    os.remove(target)
+                    raise
+                # 换下一种方式前清空目标并回到文件开头，避免残留部分数据
+                dst.truncate(0)
+                dst.seek(0)
+                src.seek(0)
+
+    copied = os.path.getsize(target)
+    if copied != size:
+        os.remove(target)
+        raise OSError(f"复制后大小不一致：{source}（{size} 字节）-> {target}（{copied} 字节）")
+    shutil.copystat(source, target)
+    return used
+
+
+def move_file(source, target):
+    """移动文件，返回实际使用的方式。同一设备上直接重命名，跨设备时先复制（并核对大小）再删除源文件"""
+    if os.stat(source).st_dev == os.stat(os.path.dirname(target) or ".").st_dev:
+        os.rename(source, target)
+        return "rename"
+    used = copy_file(source, target)
+    os.remove(source)
+    return used
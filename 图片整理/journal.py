@@ -0,0 +1,132 @@
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+
+# 整理日志（JSONL）：每行一条记录，由后台线程批量写入，文件在整次运行中只打开一次。
+# 记录类型：
+#   start  本次运行的配置
+#   log    普通日志 {"level", "message"}
+#   op     已完成的复制/移动 {"action", "source", "target", "date_source", "bytes", "method"}
+#   end    正常结束
+#   undo   已撤销
+# op 记录在文件操作完成后才写入，因此同时是撤销日志（倒序回滚 op）和续传日志（跳过已有 op 的源文件）。
+
+FLUSH_INTERVAL = 0.5   # 后台线程最长每隔多久落盘一次（秒）
+
+
+class RunJournal:
+    def __init__(self, path, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.queue = queue.Queue()
+        self.flush_interval = flush_interval
+        self.thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+        self.thread.start()
+
+    def _writer(self):
+        """取出队列中已有的全部记录一次写入，写完 flush + fsync；收到 None 时写完剩余记录后退出"""
+        stop = False
+        while not stop:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = [record for record in batch if record is not None]
+            if batch:
+                self.file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def write(self, kind, **fields):
+        fields["type"] = kind
+        fields["time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        self.queue.put(fields)
+
+    def log(self, level, message):
+        self.write("log", level=level, message=message)
+
+    def record_op(self, action, source, target, date_source, num_bytes, method):
+        self.write("op", action=action, source=source, target=target,
+                   date_source=date_source, bytes=num_bytes, method=method)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+def read_journal(path):
+    """读取日志中的全部记录；崩溃时最后一行可能只写了一半，直接忽略"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def find_unfinished(log_dir):
+    """返回最近一次没有正常结束（也没有被撤销）的日志路径及其配置，没有时返回 (None, None)"""
+    if not os.path.isdir(log_dir):
+        return None, None
+    journals = sorted(name for name in os.listdir(log_dir) if name.startswith("journal_") and name.endswith(".jsonl"))
+    for name in reversed(journals):
+        path = os.path.join(log_dir, name)
+        records = read_journal(path)
+        kinds = {record.get("type") for record in records}
+        if "end" in kinds or "undo" in kinds:
+            return None, None  # 最近一次已正常结束，更早的不再续传
+        start = next((record for record in records if record.get("type") == "start"), None)
+        if start is not None:
+            return path, start["config"]
+    return None, None
+
+
+def completed_sources(path):
+    """续传：日志中已完成操作的源文件"""
+    return {record["source"] for record in read_journal(path) if record.get("type") == "op"}
+
+
+def undo_run(path, move_file):
+    """
+    撤销一次整理：倒序回滚日志中的操作。复制的删除目标文件（大小一致时），移动的移回原位置。
+    返回 (成功数, 失败数)，撤销完成后在日志末尾写入 undo 记录，避免重复撤销。
+    """
+    records = read_journal(path)
+    if any(record.get("type") == "undo" for record in records):
+        print(f"该次整理已经撤销过：{path}")
+        return 0, 0
+
+    undone = failed = 0
+    for record in reversed([record for record in records if record.get("type") == "op"]):
+        source, target = record["source"], record["target"]
+        try:
+            if record["action"] == "copy":
+                if os.path.getsize(target) != record["bytes"]:
+                    raise OSError("目标文件大小已变化，保留不删除")
+                os.remove(target)
+            else:
+                if os.path.exists(source):
+                    raise OSError("原位置已有同名文件")
+                os.makedirs(os.path.dirname(source), exist_ok=True)
+                move_file(target, source)
+            undone += 1
+        except OSError as e:
+            failed += 1
+            print(f"撤销失败：{target}，{e}")
+
+    journal = RunJournal(path)
+    journal.write("undo", undone=undone, failed=failed)
+    journal.close()
+    return undone, failed
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+
+from hashcore import hash_file
+
+# 目标图库的内容索引：记录图库中每个文件的 (大小, 修改时间, 摘要)。
+# 摘要按需计算：只有出现同样大小的新照片时才计算并缓存，大小不同的文件永远不需要读取。
+# 同名冲突和"图库中已有同样内容的照片（文件名或月份目录不同）"都通过查询索引判断。
+# 多个图库可以共用一个索引文件，每个 LibraryIndex 只查询和同步自己的根目录下的记录。
+
+INDEX_ALGORITHM = "blake2b"
+
+
+class LibraryIndex:
+    def __init__(self, db_path, root_dir, commit_every=1000):
+        self.root_dir = os.path.abspath(root_dir)
+        self.prefix = os.path.join(self.root_dir, "")
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS library ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS library_size ON library (size)")
+        self.commit_every = commit_every
+        self.pending = 0
+        self.source_digests = {}   # 本次运行中已计算过的源文件摘要
+
+    def _changed(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+    def refresh(self):
+        """
+        与磁盘同步：新文件加入索引（摘要留空），大小或修改时间变化的清空摘要，已删除的移除。
+        只做 stat，不读取文件内容。返回 (新增, 变化, 删除) 数量。
+        """
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in self.conn.execute(
+            "SELECT path, size, mtime_ns FROM library WHERE substr(path, 1, ?) = ?",
+            (len(self.prefix), self.prefix))}
+
+        added = changed = 0
+        stack = [self.root_dir]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                old = known.pop(entry.path, None)
+                if old == (st.st_size, st.st_mtime_ns):
+                    continue
+                if old is None:
+                    added += 1
+                else:
+                    changed += 1
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO library (path, size, mtime_ns, digest) VALUES (?, ?, ?, NULL)",
+                    (entry.path, st.st_size, st.st_mtime_ns),
+                )
+                self._changed()
+
+        # 剩下的是磁盘上已不存在的文件
+        self.conn.executemany("DELETE FROM library WHERE path = ?", ((path,) for path in known))
+        self.conn.commit()
+        self.pending = 0
+        return added, changed, len(known)
+
+    def _library_digest(self, path, digest):
+        """返回图库文件的摘要，尚未计算过时现在计算并写回索引"""
+        if digest is None:
+            digest = hash_file(path, INDEX_ALGORITHM)
+            self.conn.execute("UPDATE library SET digest = ? WHERE path = ?", (digest, path))
+            self._changed()
+        return digest
+
+    def source_digest(self, file):
+        digest = self.source_digests.get(file)
+        if digest is None:
+            digest = self.source_digests[file] = hash_file(file, INDEX_ALGORITHM)
+        return digest
+
+    def find_same_content(self, file, size):
+        """查找本图库中内容与 file 相同的文件，返回其路径；图库中没有同样大小的文件时不读取任何内容"""
+        candidates = self.conn.execute(
+            "SELECT path, digest FROM library WHERE size = ? AND substr(path, 1, ?) = ?",
+            (size, len(self.prefix), self.prefix),
+        ).fetchall()
+        source = os.path.abspath(file)
+        candidates = [(path, digest) for path, digest in candidates if path != source]
+        if not candidates:
+            return None
+        digest = self.source_digest(file)
+        for path, library_digest in candidates:
+            try:
+                if self._library_digest(path, library_digest) == digest:
+                    return path
+            except OSError:
+                continue  # 刷新后被删除或无法读取
+        return None
+
+    def add(self, path, digest=None):
+        """整理完成的文件加入索引；源文件摘要已经算过时一并记录"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO library (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, digest),
+        )
+        self._changed()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
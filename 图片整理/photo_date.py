@@ -0,0 +1,318 @@
+import io
+import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from tqdm import tqdm
+
+# 拍摄时间提取：按文件头识别格式，只读取 EXIF/容器头中需要的几个字节，
+# JPEG、TIFF/RAW、HEIC/AVIF、PNG、MP4/MOV 都不需要 exifread，其他格式或解析失败时才回退到 exifread。
+
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+EXIF_DATE_FORMAT = "%Y:%m:%d %H:%M:%S"
+MP4_EPOCH = datetime(1904, 1, 1)        # MP4/MOV 的时间从 1904 年开始计秒（UTC）
+HEIF_BRANDS = {b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif", b"avis"}
+
+
+class UnsupportedFormat(Exception):
+    """文件头无法识别，交给 exifread 处理"""
+
+
+def _parse_exif_date(value):
+    try:
+        return datetime.strptime(value.split(b"\0", 1)[0].decode("ascii").strip(), EXIF_DATE_FORMAT)
+    except (UnicodeDecodeError, ValueError):
+        return None  # 如 "0000:00:00 00:00:00"
+
+
+def _read_ifd(f, base, offset, order, wanted):
+    """读取一个 IFD，返回 {标签: (类型, 数量, 值或偏移的 4 字节)}，只保留 wanted 中的标签"""
+    f.seek(base + offset)
+    count = struct.unpack(order + "H", f.read(2))[0]
+    entries = {}
+    data = f.read(count * 12)
+    for i in range(0, len(data) - 11, 12):
+        tag, kind, num = struct.unpack(order + "HHI", data[i:i + 8])
+        if tag in wanted:
+            entries[tag] = (kind, num, data[i + 8:i + 12])
+    return entries
+
+
+def read_tiff_date(f, base=0):
+    """从 TIFF 结构（base 为 TIFF 头所在偏移）中读取 DateTimeOriginal：IFD0 -> Exif IFD -> 0x9003"""
+    f.seek(base)
+    header = f.read(8)
+    if header[:4] == b"II*\0":
+        order = "<"
+    elif header[:4] == b"MM\0*":
+        order = ">"
+    else:
+        raise UnsupportedFormat("不是 TIFF 头")
+    ifd0 = _read_ifd(f, base, struct.unpack(order + "I", header[4:8])[0], order, {TAG_EXIF_IFD})
+    if TAG_EXIF_IFD not in ifd0:
+        return None
+    exif_offset = struct.unpack(order + "I", ifd0[TAG_EXIF_IFD][2])[0]
+    exif_ifd = _read_ifd(f, base, exif_offset, order, {TAG_DATETIME_ORIGINAL})
+    if TAG_DATETIME_ORIGINAL not in exif_ifd:
+        return None
+    _, num, raw = exif_ifd[TAG_DATETIME_ORIGINAL]
+    if num <= 4:
+        return _parse_exif_date(raw[:num])
+    f.seek(base + struct.unpack(order + "I", raw)[0])
+    return _parse_exif_date(f.read(num))
+
+
+def read_jpeg_date(f):
+    """逐个跳过 JPEG 段，找到 APP1 "Exif" 段后只解析该段，遇到图像数据（SOS）即停止"""
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        kind = marker[1]
+        length = struct.unpack(">H", marker[2:])[0]
+        if kind in (0xDA, 0xD9):
+            return None
+        if kind == 0xE1:
+            segment = f.read(length - 2)
+            if segment.startswith(b"Exif\0\0"):
+                return read_tiff_date(io.BytesIO(segment), 6)
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_png_date(f):
+    """PNG 的 EXIF 保存在 eXIf 块中，其他块只读块头后跳过"""
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, kind = struct.unpack(">I4s", header)
+        if kind == b"eXIf":
+            return read_tiff_date(io.BytesIO(f.read(length)))
+        if kind == b"IEND":
+            return None
+        f.seek(length + 4, os.SEEK_CUR)  # 数据 + CRC
+
+
+def _iter_boxes(f, start, end):
+    """遍历 ISO BMFF（MP4/MOV/HEIF）盒子，产出 (类型, 数据起始偏移, 数据结束偏移)"""
+    offset = start
+    while end is None or offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        data_start = offset + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            data_start += 8
+        elif size == 0:
+            size = (end if end is not None else os.fstat(f.fileno()).st_size) - offset
+        if size < data_start - offset:
+            return
+        yield kind, data_start, offset + size
+        offset += size
+
+
+def _find_box(f, kind, start, end):
+    for box_kind, data_start, data_end in _iter_boxes(f, start, end):
+        if box_kind == kind:
+            return data_start, data_end
+    return None
+
+
+def read_mp4_date(f):
+    """MP4/MOV：moov/mvhd 中的 creation_time，为 UTC，换算为本地时间"""
+    moov = _find_box(f, b"moov", 0, None)
+    mvhd = moov and _find_box(f, b"mvhd", *moov)
+    if not mvhd:
+        return None
+    f.seek(mvhd[0])
+    version = f.read(4)[0]
+    seconds = struct.unpack(">Q", f.read(8))[0] if version == 1 else struct.unpack(">I", f.read(4))[0]
+    if not seconds:
+        return None
+    utc = MP4_EPOCH + timedelta(seconds=seconds)
+    return utc.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def read_heif_date(f):
+    """
+    HEIC/AVIF：meta 盒中 iinf 找到类型为 Exif 的项目编号，再由 iloc 取得它在文件中的位置。
+    Exif 项目的数据以 4 字节的 TIFF 头偏移开始。
+    """
+    meta = _find_box(f, b"meta", 0, None)
+    if not meta:
+        return None
+    children_start = meta[0] + 4  # meta 是 FullBox，先跳过版本和标志
+    exif_id = None
+    locations = {}
+    for kind, start, end in _iter_boxes(f, children_start, meta[1]):
+        f.seek(start)
+        data = f.read(end - start)
+        if kind == b"iinf":
+            exif_id = _parse_iinf(data)
+        elif kind == b"iloc":
+            locations = _parse_iloc(data)
+    if exif_id is None or exif_id not in locations:
+        return None
+    offset, length = locations[exif_id]
+    f.seek(offset)
+    payload = f.read(length)
+    tiff_offset = struct.unpack(">I", payload[:4])[0]
+    return read_tiff_date(io.BytesIO(payload), 4 + tiff_offset)
+
+
+def _parse_iinf(data):
+    version = data[0]
+    pos = 4 + (2 if version == 0 else 4)
+    while pos + 8 <= len(data):
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        if size < 8:
+            break
+        if kind == b"infe" and data[pos + 8] >= 2:
+            body = pos + 12
+            if data[pos + 8] == 2:
+                item_id = struct.unpack(">H", data[body:body + 2])[0]
+                item_type = data[body + 4:body + 8]
+            else:
+                item_id = struct.unpack(">I", data[body:body + 4])[0]
+                item_type = data[body + 6:body + 10]
+            if item_type == b"Exif":
+                return item_id
+        pos += size
+    return None
+
+
+def _parse_iloc(data):
+    """返回 {项目编号: (文件偏移, 长度)}，只取每个项目的第一个区段（Exif 项目只有一个）"""
+    version = data[0]
+    offset_size, length_size = data[4] >> 4, data[4] & 0x0F
+    base_offset_size, index_size = data[5] >> 4, data[5] & 0x0F
+    pos = 6
+
+    def read_int(size):
+        nonlocal pos
+        value = int.from_bytes(data[pos:pos + size], "big") if size else 0
+        pos += size
+        return value
+
+    locations = {}
+    item_count = read_int(2 if version < 2 else 4)
+    for _ in range(item_count):
+        item_id = read_int(2 if version < 2 else 4)
+        construction_method = read_int(2) & 0x0F if version in (1, 2) else 0
+        read_int(2)  # data_reference_index
+        base_offset = read_int(base_offset_size)
+        extents = []
+        for _ in range(read_int(2)):
+            if version in (1, 2):
+                read_int(index_size)
+            extents.append((read_int(offset_size), read_int(length_size)))
+        if construction_method == 0 and extents:
+            locations[item_id] = (base_offset + extents[0][0], extents[0][1])
+    return locations
+
+
+def read_exifread_date(file_path):
+    import exifread
+    with open(file_path, 'rb') as f:
+        tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False)
+        date_taken = tags.get("EXIF DateTimeOriginal")
+        if date_taken:
+            return datetime.strptime(str(date_taken), EXIF_DATE_FORMAT)
+    return None
+
+
+def read_capture_date(file_path):
+    """读取拍摄时间，没有时返回 None。按文件头判断格式，无法识别或解析出错时回退到 exifread"""
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(12)
+            if head[:2] == b"\xff\xd8":
+                return read_jpeg_date(f)
+            if head[:4] in (b"II*\0", b"MM\0*"):
+                return read_tiff_date(f)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                return read_png_date(f)
+            if head[4:8] == b"ftyp":
+                return read_heif_date(f) if head[8:12] in HEIF_BRANDS else read_mp4_date(f)
+    except (OSError, struct.error, IndexError, UnsupportedFormat):
+        pass
+    try:
+        return read_exifread_date(file_path)
+    except Exception:
+        return None
+
+
+class DateCache:
+    """按 (路径, 大小, 修改时间) 缓存提取到的拍摄时间（包括"没有拍摄时间"），文件未变化时不再读取"""
+
+    def __init__(self, db_path, commit_every=1000):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS photo_date ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, taken TEXT)"
+        )
+        self.commit_every = commit_every
+        self.pending = 0
+
+    def lookup(self, path, st):
+        """命中返回 (True, 拍摄时间或 None)，未命中或文件已变化返回 (False, None)"""
+        row = self.conn.execute("SELECT size, mtime_ns, taken FROM photo_date WHERE path = ?", (path,)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            return False, None
+        return True, datetime.fromisoformat(row[2]) if row[2] else None
+
+    def store(self, path, st, taken):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO photo_date (path, size, mtime_ns, taken) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, taken.isoformat() if taken else None),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def extract_capture_dates(files, cache_path, workers=8):
+    """
+    并行提取一批文件的拍摄时间，返回 {路径: 拍摄时间或 None}。
+    缓存查询在主线程完成（SQLite 连接不跨线程），只有未命中的文件交给线程池读取。
+    """
+    dates = {}
+    stats = {}
+    misses = []
+    cache = DateCache(cache_path)
+    try:
+        for file in files:
+            try:
+                st = os.stat(file)
+            except OSError:
+                dates[file] = None
+                continue
+            hit, taken = cache.lookup(os.path.abspath(file), st)
+            if hit:
+                dates[file] = taken
+            else:
+                stats[file] = st
+                misses.append(file)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(read_capture_date, misses)
+            for file, taken in tqdm(zip(misses, results), total=len(misses), desc="Reading dates"):
+                dates[file] = taken
+                cache.store(os.path.abspath(file), stats[file], taken)
+    finally:
+        cache.close()
+    return dates
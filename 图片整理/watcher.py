@@ -0,0 +1,234 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# 监视文件夹：Linux 上使用 inotify（空闲时阻塞等待事件，不占 CPU），其他系统按目录修改时间轮询。
+# 新文件先进入待定列表，大小和修改时间连续 DEBOUNCE_SECONDS 秒不变才视为写入完成，再按小批量交给处理函数。
+
+DEBOUNCE_SECONDS = 3.0
+POLL_INTERVAL = 5.0     # 轮询模式下检查目录修改时间的间隔
+BATCH_SIZE = 50
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _is_excluded(path, exclude):
+    return any(path == root or path.startswith(os.path.join(root, "")) for root in exclude)
+
+
+def _list_dir(directory, recursive, exclude):
+    """列出目录下的文件和子目录（recursive 时包括所有层级），跳过 exclude 中的目录"""
+    files, dirs = [], []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not _is_excluded(entry.path, exclude):
+                        dirs.append(entry.path)
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry.path)
+            except OSError:
+                continue
+    return files, dirs
+
+
+class PollingWatcher:
+    """按目录修改时间轮询：目录中新增、删除、重命名文件都会改变目录的修改时间，只重新列出变化的目录"""
+
+    def __init__(self, root_dir, recursive, exclude, interval=POLL_INTERVAL):
+        self.root_dir = root_dir
+        self.recursive = recursive
+        self.exclude = exclude
+        self.interval = interval
+        self.dir_mtimes = {}
+        _, dirs = _list_dir(root_dir, recursive, exclude)
+        for directory in [root_dir] + dirs:
+            self._remember(directory)
+
+    def _remember(self, directory):
+        try:
+            self.dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+        except OSError:
+            self.dir_mtimes.pop(directory, None)
+
+    def wait(self, timeout):
+        """等待后返回可能新增或变化的文件路径"""
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        candidates = []
+        for directory, mtime_ns in list(self.dir_mtimes.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                self.dir_mtimes.pop(directory, None)
+                continue
+            if current == mtime_ns:
+                continue
+            self.dir_mtimes[directory] = current
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    candidates.append(entry.path)
+                elif self.recursive and entry.is_dir(follow_symlinks=False) and entry.path not in self.dir_mtimes \
+                        and not _is_excluded(entry.path, self.exclude):
+                    # 新的子目录：记录下来并取出其中已有的文件
+                    files, dirs = _list_dir(entry.path, True, self.exclude)
+                    candidates.extend(files)
+                    for new_dir in [entry.path] + dirs:
+                        self._remember(new_dir)
+        return candidates
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """通过 ctypes 调用 inotify，无需第三方库；事件队列溢出时退回整体重新列出"""
+
+    def __init__(self, root_dir, recursive, exclude):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.root_dir = root_dir
+        self.recursive = recursive
+        self.exclude = exclude
+        self.watches = {}
+        _, dirs = _list_dir(root_dir, recursive, exclude)
+        for directory in [root_dir] + dirs:
+            self._add_watch(directory)
+
+    def _add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"无法监视目录：{directory}")
+        self.watches[wd] = directory
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        candidates = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_len].rstrip(b"\0")
+            offset += EVENT_HEADER.size + name_len
+            if mask & IN_Q_OVERFLOW:
+                # 事件太多被丢弃：重新列出整个目录树，由调用方按已处理集合过滤
+                files, _ = _list_dir(self.root_dir, self.recursive, self.exclude)
+                candidates.extend(files)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and not _is_excluded(path, self.exclude):
+                    # 新目录：先加监视，再列出加监视之前已经写入的文件
+                    files, dirs = _list_dir(path, True, self.exclude)
+                    for new_dir in [path] + dirs:
+                        try:
+                            self._add_watch(new_dir)
+                        except OSError:
+                            pass
+                    candidates.extend(files)
+            else:
+                candidates.append(path)
+        return candidates
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(root_dir, recursive, exclude=()):
+    """Linux 上优先使用 inotify，不可用时（其他系统、监视数量超限等）退回轮询"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root_dir, recursive, exclude)
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用（{e}），改用轮询")
+    return PollingWatcher(root_dir, recursive, exclude)
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def watch(root_dir, recursive, on_batch, exclude=(), debounce=DEBOUNCE_SECONDS, batch_size=BATCH_SIZE):
+    """
+    持续监视 root_dir，把写入完成的新文件按批交给 on_batch(文件列表)。
+    启动时已有的文件先作为第一批处理。按 Ctrl+C 结束。
+    """
+    watcher = create_watcher(root_dir, recursive, exclude)
+    print(f"正在监视：{root_dir}（{'inotify' if isinstance(watcher, InotifyWatcher) else '轮询'}），按 Ctrl+C 结束")
+
+    seen = {}      # 已处理的文件 -> (大小, 修改时间)，同一文件内容变化后会再次处理
+    pending = {}   # 待定文件 -> ((大小, 修改时间), 最后一次变化的时间)
+    existing, _ = _list_dir(root_dir, recursive, exclude)
+    for path in existing:
+        pending[path] = (_signature(path), 0.0)
+
+    try:
+        while True:
+            # 有待定文件时定时醒来检查是否写完，否则一直阻塞等待事件
+            timeout = min(debounce, 1.0) if pending else None
+            now = time.monotonic()
+            for path in watcher.wait(timeout):
+                signature = _signature(path)
+                if signature is not None and seen.get(path) != signature:
+                    old = pending.get(path)
+                    if old is None or old[0] != signature:
+                        pending[path] = (signature, now)
+
+            now = time.monotonic()
+            ready = []
+            for path, (signature, changed_at) in list(pending.items()):
+                current = _signature(path)
+                if current is None:
+                    del pending[path]  # 已被删除或移走
+                elif current != signature:
+                    pending[path] = (current, now)
+                elif now - changed_at >= debounce:
+                    ready.append(path)
+
+            ready.sort()
+            for start in range(0, len(ready), batch_size):
+                batch = ready[start:start + batch_size]
+                on_batch(batch)
+                for path in batch:
+                    signature = pending.pop(path)[0]
+                    if os.path.exists(path):
+                        seen[path] = signature
+    except KeyboardInterrupt:
+        print("\n已停止监视。")
+    finally:
+        watcher.close()
@@ -1,25 +1,37 @@
 import os
-import shutil
-import hashlib
+import sys
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 from tqdm import tqdm  # 用于显示进度条
 
+# 共用的哈希模块在 Hash 目录下
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Hash"))
+from fastcopy import METHOD_NAMES, copy_file, move_file
+from journal import RunJournal, completed_sources, find_unfinished, undo_run
+from library_index import LibraryIndex
+from watcher import watch
+from photo_date import extract_capture_dates
+
 CONFIG_FILE = "photo_organizer_config.json"
 LOG_DIR = "log"
+DATE_CACHE_FILE = "photo_date_cache.db"   # 拍摄时间缓存，文件大小和修改时间不变时不再读取
+DATE_WORKERS = 8                          # 并行读取拍摄时间的线程数
+COPY_WORKERS = 4                          # 并行复制/移动文件的线程数
+LIBRARY_INDEX_FILE = "photo_library_index.db"  # 目标图库的内容索引（大小 -> 摘要，按需计算）
 
-# 初始化日志文件
-def init_logger():
+# 初始化本次运行的日志（JSONL，后台线程批量写入）；续传时继续写入上次的日志
+def init_journal(config, resume_path=None):
+    if resume_path:
+        journal = RunJournal(resume_path)
+        journal.log("INFO", "继续上次未完成的整理")
+        return journal
     os.makedirs(LOG_DIR, exist_ok=True)
-    log_file = os.path.join(LOG_DIR, f"log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-    return log_file
-
-# 写日志
-def log_message(log_file, level, message):
-    with open(log_file, "a", encoding="utf-8") as f:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        f.write(f"{timestamp}|{level}|照片整理|{message}\n")
+    # 文件名精确到毫秒，同一秒内连续运行也不会写进同一个日志
+    journal = RunJournal(os.path.join(LOG_DIR, f"journal_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}.jsonl"))
+    journal.write("start", config=config)
+    return journal
 
 # 加载配置
 def load_config():
@@ -33,19 +45,8 @@ def save_config(config):
     with open(CONFIG_FILE, "w", encoding="utf-8") as f:
         json.dump(config, f, ensure_ascii=False, indent=4)
 
-# 获取文件的日期信息
-def get_file_date(file_path, fallback_method):
-    try:
-        import exifread
-        with open(file_path, 'rb') as f:
-            tags = exifread.process_file(f, stop_tag="EXIF DateTimeOriginal", details=False)
-            date_taken = tags.get("EXIF DateTimeOriginal")
-            if date_taken:
-                return datetime.strptime(str(date_taken), "%Y:%m:%d %H:%M:%S")
-    except Exception:
-        pass
-
-    # 根据备选方法获取时间
+# 没有拍摄时间时根据备选方法获取时间
+def get_fallback_date(file_path, fallback_method):
     stat = os.stat(file_path)
     if fallback_method == 2:
         return datetime.fromtimestamp(stat.st_mtime)
@@ -74,79 +75,240 @@ def generate_target_path(base_dir, date, structure):
     else:
         raise ValueError("Invalid directory structure.")
 
-# 比较文件内容是否相同
-def files_are_identical(file1, file2):
-    hash1 = hashlib.md5()
-    hash2 = hashlib.md5()
-
-    with open(file1, "rb") as f1, open(file2, "rb") as f2:
-        while chunk := f1.read(8192):
-            hash1.update(chunk)
-        while chunk := f2.read(8192):
-            hash2.update(chunk)
-
-    return hash1.digest() == hash2.digest()
-
-# 主处理逻辑
-def process_photos(config):
-    log_file = init_logger()
-    source_dir = config["source_dir"]
-    include_subdirs = config["include_subdirs"]
+# 第一阶段：在内存中生成整理计划
+# 每个目标目录只列一次目录内容，同名冲突在内存中的文件名集合里解决，不逐个文件调用 exists；
+# 智能处理时通过图库内容索引判断照片是否已在图库中（不论文件名和所在目录）
+def build_plan(files, capture_dates, config, journal, library=None):
     target_dir = config["target_dir"]
     dir_structure = config["dir_structure"]
-    action = config["action"]
     fallback_method = config["fallback_method"]
     conflict_resolution = config["conflict_resolution"]
 
-    # 遍历源文件夹
-    if include_subdirs:
-        files = [os.path.join(root, file) for root, _, filenames in os.walk(source_dir) for file in filenames]
-    else:
-        files = [os.path.join(source_dir, file) for file in os.listdir(source_dir) if os.path.isfile(os.path.join(source_dir, file))]
+    dir_names = {}      # 目标目录 -> 目录中已有和已计划的文件名（normcase 后）
+    planned_sizes = {}  # 大小 -> 本批已计划的源文件，用于同一批内的内容比较
+    new_dirs = []       # 需要新建的目标目录
+    plan = []           # [(源文件, 目标文件, 大小, 日期来源), ...]
 
-    log_message(log_file, "INFO", f"总文件数：{len(files)}")
-    processed_count = 0
-
-    for file in tqdm(files, desc="Processing files"):
-        date = get_file_date(file, fallback_method)
+    for file in files:
+        date = capture_dates.get(file)
+        date_source = "exif"
+        try:
+            if not date:
+                date = get_fallback_date(file, fallback_method)
+                date_source = "mtime" if fallback_method == 2 else "ctime"
+            size = os.path.getsize(file)
+        except OSError as e:
+            # 读取拍摄时间之后被改名或删除（例如监视模式下上传中途取消）
+            journal.log("WARNING", f"跳过文件：{file}，{e}")
+            continue
         if not date:
-            log_message(log_file, "WARNING", f"跳过文件：{file}，无法获取日期信息。")
+            journal.log("WARNING", f"跳过文件：{file}，无法获取日期信息。")
             continue
 
         target_path = generate_target_path(target_dir, date, dir_structure)
-        os.makedirs(target_path, exist_ok=True)
+        names = dir_names.get(target_path)
+        if names is None:
+            try:
+                names = {os.path.normcase(name) for name in os.listdir(target_path)}
+            except FileNotFoundError:
+                names = set()
+                new_dirs.append(target_path)
+            dir_names[target_path] = names
 
-        target_file = os.path.join(target_path, os.path.basename(file))
+        if conflict_resolution == 1 and library is not None:
+            try:
+                same = library.find_same_content(file, size) or next(
+                    (other for other in planned_sizes.get(size, ())
+                     if library.source_digest(other) == library.source_digest(file)), None)
+            except OSError as e:
+                journal.log("WARNING", f"跳过文件：{file}，{e}")
+                continue
+            if same:
+                journal.log("INFO", f"图库中已有相同内容的文件，跳过：{file}（{same}）")
+                continue
 
-        if os.path.exists(target_file):
-            if conflict_resolution == 1:  # 智能处理
-                if files_are_identical(file, target_file):
-                    log_message(log_file, "INFO", f"文件已存在且内容相同，跳过：{file}")
-                    continue
-                base, ext = os.path.splitext(target_file)
+        name = os.path.basename(file)
+        if os.path.normcase(name) in names:
+            if conflict_resolution == 1:  # 智能处理：内容不同的同名文件重命名后保存
+                base, ext = os.path.splitext(name)
                 counter = 1
-                while os.path.exists(new_name := f"{base} ({counter}){ext}"):
+                while os.path.normcase(new_name := f"{base} ({counter}){ext}") in names:
                     counter += 1
-                target_file = new_name
+                name = new_name
             elif conflict_resolution == 2:  # 跳过
-                log_message(log_file, "INFO", f"文件已存在，跳过：{file}")
+                journal.log("INFO", f"文件已存在，跳过：{file}")
+                continue
+
+        target_file = os.path.join(target_path, name)
+        names.add(os.path.normcase(name))
+        planned_sizes.setdefault(size, []).append(file)
+        plan.append((file, target_file, size, date_source))
+
+    return plan, new_dirs
+
+# 预览整理计划，不改动任何文件
+def print_plan(plan, new_dirs, action):
+    verb = "复制" if action == 1 else "移动"
+    for file, target_file, _, _ in plan:
+        print(f"{verb} {file} -> {target_file}")
+    total_bytes = sum(item[2] for item in plan)
+    print(f"\n计划{verb} {len(plan)} 个文件，共 {total_bytes / 1024 ** 2:.1f} MB，新建 {len(new_dirs)} 个目录。")
+
+# 整理单个文件，返回实际使用的复制/移动方式
+def execute_item(file, target_file, action):
+    if action == 1:  # 复制
+        return copy_file(file, target_file)
+    elif action == 2:  # 移动
+        return move_file(file, target_file)
+
+# 第二阶段：先一次性建好目录，再由有限数量的线程并行执行计划
+def execute_plan(plan, new_dirs, action, journal, library=None):
+    for target_path in new_dirs:
+        os.makedirs(target_path, exist_ok=True)
+
+    verb = "复制" if action == 1 else "移动"
+    processed_count = 0
+    method_counts = {}
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        futures = {executor.submit(execute_item, item[0], item[1], action): item for item in plan}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing files"):
+            file, target_file, size, date_source = futures[future]
+            try:
+                method = future.result()
+            except OSError as e:
+                journal.log("ERROR", f"{verb}失败：{file}，{e}")
                 continue
+            # 操作完成后才记录，日志中的 op 即可用于撤销和续传
+            journal.record_op("copy" if action == 1 else "move", file, target_file, date_source, size, method)
+            if library is not None:
+                library.add(target_file, library.source_digests.get(file))
+            method_counts[method] = method_counts.get(method, 0) + 1
+            processed_count += 1
+    return processed_count, method_counts
+
+# 主处理逻辑；resume_path 为上次未完成的日志时，跳过其中已完成的文件
+def process_photos(config, dry_run=False, resume_path=None):
+    journal = init_journal(config, resume_path)
+    library = LibraryIndex(LIBRARY_INDEX_FILE, config["target_dir"]) if config["conflict_resolution"] == 1 else None
+    try:
+        run_photos(config, journal, dry_run, resume_path, library)
+    finally:
+        journal.close()
+        if library is not None:
+            library.close()
+
+def run_photos(config, journal, dry_run, resume_path, library):
+    source_dir = config["source_dir"]
+    include_subdirs = config["include_subdirs"]
+
+    # 遍历源文件夹
+    if include_subdirs:
+        files = [os.path.join(root, file) for root, _, filenames in os.walk(source_dir) for file in filenames]
+    else:
+        files = [os.path.join(source_dir, file) for file in os.listdir(source_dir) if os.path.isfile(os.path.join(source_dir, file))]
+
+    if resume_path:
+        done = completed_sources(resume_path)
+        files = [file for file in files if file not in done]
+        print(f"继续上次的整理，已完成 {len(done)} 个文件，剩余 {len(files)} 个文件。")
 
-        if action == 1:  # 复制
-            shutil.copy2(file, target_file)
-            log_message(log_file, "INFO", f"复制 {file} 到 {target_file}")
-        elif action == 2:  # 移动
-            shutil.move(file, target_file)
-            log_message(log_file, "INFO", f"移动 {file} 到 {target_file}")
+    refresh_library(config, journal, library)
+    processed_count, method_counts = organize_files(files, config, journal, library, dry_run)
+    if dry_run:
+        journal.write("end", dry_run=True)
+        return
 
-        processed_count += 1
+    journal.write("end", processed=processed_count, total=len(files), methods=method_counts)
+    print(f"整理日志：{journal.path}（可用 --undo 撤销本次整理）")
 
-    log_message(log_file, "INFO", f"处理完成，共处理了 {processed_count}/{len(files)} 个文件。")
+# 同步图库索引，只做 stat；新增或变化的文件等到需要比较时才计算摘要
+def refresh_library(config, journal, library):
+    if library is not None and os.path.isdir(config["target_dir"]):
+        added, changed, removed = library.refresh()
+        journal.log("INFO", f"图库索引：新增 {added}，变化 {changed}，删除 {removed}")
+
+# 整理一批文件：读取拍摄时间、生成计划、执行（dry_run 时只打印计划）
+def organize_files(files, config, journal, library, dry_run=False):
+    action = config["action"]
+    journal.log("INFO", f"总文件数：{len(files)}")
+
+    # 先并行读取所有文件的拍摄时间（命中缓存的不再读取），再生成整理计划
+    capture_dates = extract_capture_dates(files, DATE_CACHE_FILE, DATE_WORKERS)
+    plan, new_dirs = build_plan(files, capture_dates, config, journal, library)
+
+    if dry_run:
+        print_plan(plan, new_dirs, action)
+        return 0, {}
+
+    processed_count, method_counts = execute_plan(plan, new_dirs, action, journal, library)
+    methods = "，".join(f"{METHOD_NAMES[method]} {count}" for method, count in method_counts.items())
     print(f"\n处理完成，共处理了 {processed_count}/{len(files)} 个文件。")
+    if methods:
+        print(f"方式统计：{methods}")
+    return processed_count, method_counts
+
+# 监视模式：python 图片整理.py --watch，使用保存的配置，源文件夹中写入完成的新文件按小批量整理
+def watch_folder():
+    config = load_config()
+    if not config:
+        print("还没有保存的配置，请先正常运行一次完成配置。")
+        return
+    journal = init_journal(config)
+    library = LibraryIndex(LIBRARY_INDEX_FILE, config["target_dir"]) if config["conflict_resolution"] == 1 else None
+    try:
+        # 图库索引只在启动时同步一次，之后整理的文件由 execute_plan 逐个加入
+        refresh_library(config, journal, library)
+        total = {"processed": 0}
+
+        def on_batch(files):
+            # 一批出错只记录日志，监视继续进行
+            try:
+                processed_count, _ = organize_files(files, config, journal, library)
+            except OSError as e:
+                journal.log("ERROR", f"整理失败：{len(files)} 个文件，{e}")
+                return
+            total["processed"] += processed_count
+
+        # 目标文件夹位于源文件夹内时不监视它，否则整理出的文件会被当作新文件再次处理
+        exclude = [os.path.abspath(config["target_dir"])]
+        try:
+            watch(os.path.abspath(config["source_dir"]), config["include_subdirs"], on_batch, exclude)
+        finally:
+            # 监视会话不需要续传，异常退出时也写入结束记录，下次运行不会提示继续整个会话
+            journal.write("end", processed=total["processed"], watch=True)
+    finally:
+        journal.close()
+        if library is not None:
+            library.close()
+
+# 撤销一次整理：python 图片整理.py --undo <日志文件>
+def undo(journal_path):
+    undone, failed = undo_run(journal_path, move_file)
+    print(f"撤销完成：恢复 {undone} 个文件，失败 {failed} 个。")
 
 # 主程序入口
 def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--undo":
+        undo(sys.argv[2])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "--watch":
+        watch_folder()
+        return
+
     while True:
+        # 上次整理中途退出时，可以从最后一个已完成的文件继续
+        resume_path, resume_config = find_unfinished(LOG_DIR)
+        if resume_path:
+            if input(f"检测到未完成的整理（{resume_path}），输入回车继续  输入任意字符放弃: ") == "":
+                process_photos(resume_config, resume_path=resume_path)
+                print("-------------------------")
+                if input("是否继续整理其他文件？(回车继续，输入任意字符退出): "):
+                    break
+                continue
+            journal = RunJournal(resume_path)
+            journal.write("end", abandoned=True)
+            journal.close()
+
         config = load_config()
 
         print("-------------------------")
@@ -191,7 +353,7 @@ def main():
 
             print("-------------------------")
             print("目标文件夹存在同名文件时")
-            print("1. 智能处理(推荐,使用Hash对比文件,如果相同就覆盖,不同就重命名后保存)")
+            print("1. 智能处理(推荐,使用Hash对比文件,图库中已有相同照片就跳过,同名但内容不同就重命名后保存)")
             print("2. 跳过")
             conflict_resolution = int(input(f"选择冲突处理方法({config.get('conflict_resolution', 1)}): ") or config.get("conflict_resolution", 1))
 
@@ -206,7 +368,8 @@ def main():
             }
             save_config(config)
 
-        process_photos(config)
+        dry_run = input("输入回车开始整理  输入 p 只预览整理计划（不复制、不移动任何文件）: ").strip().lower() == "p"
+        process_photos(config, dry_run)
         print("-------------------------")
         if input("是否继续整理其他文件？(回车继续，输入任意字符退出): "):
             break
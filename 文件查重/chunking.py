@@ -0,0 +1,222 @@
+import hashlib
+import os
+
+import numpy as np
+
+# 内容定义分块（FastCDC 风格）：用 Gear 滚动哈希寻找切分点，插入或删除数据只影响附近一两个块，
+# 因此能找出虚拟机镜像、剪辑过的视频、增量压缩包等"大部分相同"的大文件之间的共享数据。
+CDC_AVG_SIZE = 32 * 1024
+CDC_MIN_SIZE = CDC_AVG_SIZE // 4
+CDC_MAX_SIZE = CDC_AVG_SIZE * 8
+READ_BLOCK_SIZE = 1024 * 1024       # 每次读入的数据量，与未切完的尾部拼接后整体计算；块小一些中间数组能留在 CPU 缓存中
+DIGEST_SIZE = 16                    # 每个块保存 16 字节 blake2b 摘要
+
+# Gear 表：每个字节值对应一个 32 位随机数。由 md5 派生，保证每次运行、每台机器的切分点都一致
+GEAR = np.array([int.from_bytes(hashlib.md5(bytes([i])).digest()[:4], "little") for i in range(256)],
+                dtype=np.uint32)
+GEAR_WINDOW = 32   # 32 位 Gear 哈希只取决于最近 32 个字节
+
+
+def _masks(avg_size):
+    """
+    归一化分块：未到平均大小前用更难命中的掩码（多 2 位），超过后用更容易命中的掩码（少 2 位），
+    让块大小集中在平均值附近。Gear 哈希低位只由最近几个字节决定，掩码取高位。
+    """
+    bits = max(int(avg_size).bit_length() - 1, 4)
+
+    def top_bits(n):
+        return np.uint32(((1 << n) - 1) << (32 - n))
+
+    return top_bits(bits + 2), top_bits(bits - 2)
+
+
+def gear_hashes(data):
+    """
+    向量化计算每个位置的 Gear 哈希 h[i] = sum(GEAR[data[i-k]] << k, k < 32)（按 32 位截断）。
+    利用 H_2m[i] = H_m[i] + (H_m[i-m] << m) 倍增，只需 5 次整数组运算，而不是逐字节循环。
+    """
+    h = GEAR[np.frombuffer(data, dtype=np.uint8)]
+    span = 1
+    while span < GEAR_WINDOW:
+        # 右侧先整体算出临时数组再原地相加，重叠切片不会读到本轮已更新的值
+        h[span:] += h[:-span] << np.uint32(span)
+        span *= 2
+    return h
+
+
+def _cut_points(data, final, min_size, avg_size, max_size, mask_small, mask_large):
+    """
+    在 data 中依次找出切分点（块的结束位置）。data 总是从一个块的开头开始；
+    final 为 False 时，最后一段不足 max_size 且找不到切分点的数据留给下一轮。
+    """
+    h = gear_hashes(data)
+    small = np.flatnonzero((h & mask_small) == 0) + 1
+    large = np.flatnonzero((h & mask_large) == 0) + 1
+    cuts = []
+    start = 0
+    size = len(data)
+    while start < size:
+        # 先在 [min, avg) 内找难命中的切分点，再在 [avg, max) 内找容易命中的
+        cut = None
+        i = np.searchsorted(small, start + min_size)
+        if i < len(small) and small[i] < start + avg_size:
+            cut = int(small[i])
+        else:
+            i = np.searchsorted(large, start + avg_size)
+            if i < len(large) and large[i] < start + max_size:
+                cut = int(large[i])
+            elif start + max_size <= size:
+                cut = start + max_size
+        if cut is None or cut > size:
+            if not final:
+                break
+            cut = size
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def chunk_file(file_path, avg_size=CDC_AVG_SIZE, min_size=CDC_MIN_SIZE, max_size=CDC_MAX_SIZE):
+    """
+    流式分块，返回 (摘要, 长度)：摘要为 n*16 字节的 bytes，长度为 uint32 数组。
+    每个块不生成单独的 Python 对象，内存占用约为每块 20 字节。
+    """
+    mask_small, mask_large = _masks(avg_size)
+
+    digests = bytearray()
+    lengths = []
+    pending = b""
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            final = not block
+            data = pending + block if pending else block
+            if not data:
+                break
+            start = 0
+            view = memoryview(data)
+            for cut in _cut_points(data, final, min_size, avg_size, max_size, mask_small, mask_large):
+                digests += hashlib.blake2b(view[start:cut], digest_size=DIGEST_SIZE).digest()
+                lengths.append(cut - start)
+                start = cut
+            view.release()
+            pending = data[start:]
+            if final:
+                break
+    return bytes(digests), np.array(lengths, dtype=np.uint32)
+
+
+class ChunkIndex:
+    """
+    紧凑的块索引：所有块的摘要、长度、所属文件编号分别保存在 NumPy 数组中。
+    分析时对摘要排序，相同摘要相邻，去重统计全部是数组运算。
+    """
+
+    def __init__(self):
+        self.paths = []
+        self._digests = []
+        self._lengths = []
+        self._file_ids = []
+
+    def add(self, file_path, digests, lengths):
+        file_id = len(self.paths)
+        self.paths.append(file_path)
+        self._digests.append(np.frombuffer(digests, dtype=np.uint64).reshape(-1, DIGEST_SIZE // 8))
+        self._lengths.append(lengths)
+        self._file_ids.append(np.full(len(lengths), file_id, dtype=np.uint32))
+
+    def _columns(self):
+        if not self._lengths:
+            empty = np.zeros(0, dtype=np.uint64)
+            return empty, empty, np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint32)
+        digests = np.concatenate(self._digests)
+        return (digests[:, 0], digests[:, 1],
+                np.concatenate(self._lengths).astype(np.uint64), np.concatenate(self._file_ids))
+
+    def analyze(self, group_of, pair_max_files=8, top_pairs=20):
+        """
+        group_of(路径) 返回文件所属的统计分组（如所在目录）。返回 (总体统计, 各分组统计, 共享最多的文件对)：
+        - 总体/分组统计为 (总字节, 去重后字节, 块数, 唯一块数)，分组内只在该分组内部去重
+        - 文件对为 [(共享字节, 文件1, 文件2), ...]；出现在超过 pair_max_files 个文件中的块
+          （如全零块）不计入文件对，避免组合数爆炸
+        """
+        hi, lo, lengths, file_ids = self._columns()
+        total = (int(lengths.sum()), 0, len(lengths), 0)
+        if not len(lengths):
+            return total, {}, []
+
+        # 全局去重：按摘要排序后，与前一个摘要不同的位置是唯一块
+        order = np.lexsort((lo, hi))
+        hi, lo, lengths, file_ids = hi[order], lo[order], lengths[order], file_ids[order]
+        first = np.ones(len(hi), dtype=bool)
+        first[1:] = (hi[1:] != hi[:-1]) | (lo[1:] != lo[:-1])
+        total = (int(lengths.sum()), int(lengths[first].sum()), len(lengths), int(first.sum()))
+
+        # 分组内去重：同一摘要内再按分组排序，(分组, 摘要) 首次出现的块计入去重后大小
+        group_ids = {}
+        file_group = np.array([group_ids.setdefault(group_of(path), len(group_ids)) for path in self.paths],
+                              dtype=np.uint32)
+        group_names = sorted(group_ids, key=group_ids.get)
+        groups = file_group[file_ids]
+        digest_id = np.cumsum(first) - 1
+        sub_order = np.lexsort((groups, digest_id))
+        sorted_groups, sorted_digest = groups[sub_order], digest_id[sub_order]
+        group_first = np.ones(len(sub_order), dtype=bool)
+        group_first[1:] = (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_digest[1:] != sorted_digest[:-1])
+        group_lengths = lengths[sub_order]
+        count = len(group_names)
+        group_total = np.bincount(sorted_groups, weights=group_lengths, minlength=count)
+        group_unique = np.bincount(sorted_groups[group_first], weights=group_lengths[group_first], minlength=count)
+        group_chunks = np.bincount(sorted_groups, minlength=count)
+        group_unique_chunks = np.bincount(sorted_groups[group_first], minlength=count)
+        per_group = {
+            name: (int(group_total[i]), int(group_unique[i]), int(group_chunks[i]), int(group_unique_chunks[i]))
+            for i, name in enumerate(group_names)
+        }
+
+        return total, per_group, self._top_pairs(digest_id, file_ids, lengths, pair_max_files, top_pairs)
+
+    def _top_pairs(self, digest_id, file_ids, lengths, pair_max_files, top_pairs):
+        """统计两两文件之间共享的字节数；只遍历出现在 2~pair_max_files 个不同文件中的块"""
+        # 同一文件内重复的块只算一次
+        order = np.lexsort((file_ids, digest_id))
+        digest_id, file_ids, lengths = digest_id[order], file_ids[order], lengths[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (digest_id[1:] != digest_id[:-1]) | (file_ids[1:] != file_ids[:-1])
+        digest_id, file_ids, lengths = digest_id[keep], file_ids[keep], lengths[keep]
+
+        starts = np.flatnonzero(np.r_[True, digest_id[1:] != digest_id[:-1]])
+        counts = np.diff(np.r_[starts, len(digest_id)])
+        shared = {}
+        for start, n in zip(starts[(counts > 1) & (counts <= pair_max_files)],
+                            counts[(counts > 1) & (counts <= pair_max_files)]):
+            members = file_ids[start:start + n].tolist()
+            size = int(lengths[start])
+            for i in range(n):
+                for j in range(i + 1, n):
+                    key = (members[i], members[j])
+                    shared[key] = shared.get(key, 0) + size
+
+        pairs = sorted(shared.items(), key=lambda item: item[1], reverse=True)[:top_pairs]
+        return [(size, self.paths[a], self.paths[b]) for (a, b), size in pairs]
+
+
+def chunk_task(file_path):
+    """供 HashEngine 并行调用，读取失败时返回 None"""
+    try:
+        return chunk_file(file_path)
+    except OSError as e:
+        print(f"无法读取，跳过：{file_path}（{e}）")
+        return None
+
+
+def default_group(root_dirs):
+    """统计分组：文件所在根目录下的第一级子目录（直接位于根目录的文件归入根目录本身）"""
+    def group_of(path):
+        for root_dir in sorted(root_dirs, key=len, reverse=True):
+            if path.startswith(os.path.join(root_dir, "")):
+                rel = os.path.relpath(path, root_dir)
+                head = rel.split(os.sep, 1)
+                return os.path.join(root_dir, head[0]) if len(head) > 1 else root_dir
+        return os.path.dirname(path)
+    return group_of
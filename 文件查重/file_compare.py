@@ -0,0 +1,67 @@
+import threading
+from contextlib import ExitStack
+
+from hashcore import new_hasher, read_full
+
+# 逐块同步比较文件内容：查重时只剩少数文件的候选组直接比较，替换为链接前再确认一次内容相同
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024   # 每个文件每次读取的块大小
+
+# 每个线程复用自己的比较缓冲区，避免每次读取都分配新的 bytes 对象
+_compare_buffers = threading.local()
+
+
+def compare_files_lockstep(first_path, other_paths, chunk_size=DEFAULT_CHUNK_SIZE, algorithm=None):
+    """
+    逐块同步读取多个同大小的文件并直接比较内容，返回 (内容相同的文件组列表, 实际读取的字节数, 摘要)。
+    某个文件与其他文件都不同后就不再读取它，全部互不相同时立即结束。
+    指定 algorithm 时边读边计算哈希，摘要为 {路径: 十六进制摘要}，只包含读完整个文件的（即内容相同的）文件。
+    """
+    paths = [first_path] + list(other_paths)
+    hashers = [new_hasher(algorithm) for _ in paths] if algorithm else None
+    buffers = getattr(_compare_buffers, "buffers", [])
+    if len(buffers) < len(paths) or len(buffers[0]) != chunk_size:
+        buffers = [bytearray(chunk_size) for _ in paths]
+        _compare_buffers.buffers = buffers
+    views = [memoryview(buffer) for buffer in buffers[:len(paths)]]
+
+    identical = []
+    bytes_read = 0
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(path, 'rb', buffering=0)) for path in paths]
+        groups = [list(range(len(paths)))]
+        while groups:
+            next_groups = []
+            for group in groups:
+                lengths = {}
+                for i in group:
+                    lengths[i] = read_full(files[i], views[i])
+                    bytes_read += lengths[i]
+                    if hashers is not None:
+                        hashers[i].update(views[i][:lengths[i]])
+
+                # 与每一类的代表文件比较，把当前组按这一块的内容细分
+                classes = []
+                for i in group:
+                    for cls in classes:
+                        j = cls[0]
+                        if lengths[i] == lengths[j] and views[i][:lengths[i]] == views[j][:lengths[j]]:
+                            cls.append(i)
+                            break
+                    else:
+                        classes.append([i])
+
+                for cls in classes:
+                    if len(cls) < 2:
+                        continue
+                    if lengths[cls[0]] < chunk_size:
+                        identical.append([paths[i] for i in cls])  # 已读到文件末尾，内容完全相同
+                    else:
+                        next_groups.append(cls)
+            groups = next_groups
+    digests = {}
+    if hashers is not None:
+        for group in identical:
+            for path in group:
+                digests[path] = hashers[paths.index(path)].hexdigest()
+    return identical, bytes_read, digests
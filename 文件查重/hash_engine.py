@@ -0,0 +1,113 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def is_rotational(dev):
+    """
+    判断设备号对应的块设备是否为机械硬盘。
+    只在 Linux 上通过 /sys/dev/block 判断，无法判断时返回 None。
+    """
+    if not hasattr(os, "major"):
+        return None
+    sys_path = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    try:
+        real_path = os.path.realpath(sys_path)
+        # 分区本身没有 queue 目录，需要查看上一级的整块磁盘
+        for candidate in (real_path, os.path.dirname(real_path)):
+            flag_file = os.path.join(candidate, "queue", "rotational")
+            if os.path.exists(flag_file):
+                with open(flag_file, "r") as f:
+                    return f.read().strip() == "1"
+    except OSError:
+        pass
+    return None
+
+
+class HashEngine:
+    """
+    并行哈希引擎。
+
+    每个底层块设备使用独立的线程池：固态硬盘可以同时读取多个文件，
+    机械硬盘只保留 1~2 个读取线程，避免磁头来回寻道。
+    hashlib 在计算大块数据时会释放 GIL，所以线程池即可跑满多核。
+    """
+
+    def __init__(self, ssd_readers=8, hdd_readers=2, default_readers=4):
+        self.ssd_readers = ssd_readers
+        self.hdd_readers = hdd_readers
+        self.default_readers = default_readers
+        self.executors = {}
+        self.dir_devices = {}
+
+        # 吞吐统计
+        self.started = time.perf_counter()
+        self.files_done = 0
+        self.bytes_done = 0
+        self.last_report = 0.0
+
+    def _device_of(self, path):
+        """同一目录下的文件在同一设备上，按目录缓存设备号，减少 stat 调用"""
+        directory = os.path.dirname(path)
+        dev = self.dir_devices.get(directory)
+        if dev is None:
+            dev = os.stat(directory or ".").st_dev
+            self.dir_devices[directory] = dev
+        return dev
+
+    def _executor_for(self, path, dev=None):
+        if dev is None:
+            dev = self._device_of(path)
+        executor = self.executors.get(dev)
+        if executor is None:
+            rotational = is_rotational(dev)
+            if rotational is None:
+                workers = self.default_readers
+            elif rotational:
+                workers = self.hdd_readers
+            else:
+                workers = self.ssd_readers
+            executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix=f"hash-{dev}")
+            self.executors[dev] = executor
+        return executor
+
+    def map(self, func, tasks):
+        """
+        并行执行 func(path, *args)，tasks 为 (path, 读取字节数, args[, 设备号]) 的列表，
+        扫描阶段已知设备号时一并传入，省去再次 stat。
+        结果按提交顺序依次产出 (path, 结果)，保证进度输出有序。
+        """
+        futures = []
+        for path, num_bytes, args, *dev in tasks:
+            executor = self._executor_for(path, dev[0] if dev else None)
+            futures.append((path, num_bytes, executor.submit(func, path, *args)))
+
+        for path, num_bytes, future in futures:
+            result = future.result()
+            self.files_done += 1
+            self.bytes_done += num_bytes
+            yield path, result
+
+    def add_bytes(self, num_bytes):
+        """任务实际读取量事先未知（如逐块比较提前结束）时，完成后再补记读取的字节数"""
+        self.bytes_done += num_bytes
+
+    def throughput(self):
+        """返回 (文件/秒, MB/秒)"""
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        return self.files_done / elapsed, self.bytes_done / elapsed / (1024 * 1024)
+
+    def report_progress(self, processed, total, force=False, interval=0.5):
+        """打印汇总进度和吞吐量，默认每 0.5 秒最多输出一次；total 为 None 表示总数未知"""
+        now = time.perf_counter()
+        if not force and now - self.last_report < interval:
+            return
+        self.last_report = now
+        files_per_sec, mb_per_sec = self.throughput()
+        count = f"{processed}/{total}" if total is not None else f"{processed}"
+        print(f"Hash已经处理({count}) {files_per_sec:.1f} 文件/秒 {mb_per_sec:.1f} MB/秒")
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        self.executors.clear()
@@ -0,0 +1,226 @@
+import os
+import sqlite3
+import time
+
+# 清理记录后，空闲页超过数据库总页数的这个比例才执行 VACUUM（VACUUM 会重写整个数据库文件）
+VACUUM_FREE_RATIO = 0.25
+
+
+def _sqlite_int(value):
+    """SQLite 只支持有符号 64 位整数，超出范围的设备号/inode 折算成负数保存"""
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return value
+
+
+def _sqlite_path(path):
+    """
+    路径按文件系统的原始字节保存（BLOB）：Linux 上文件名可以不是合法的 UTF-8，
+    这样的 str 含有代理字符，不能作为 SQLite 文本写入
+    """
+    return os.fsencode(path)
+
+
+def _prefix_range(prefix):
+    """以 prefix（字节串）开头的路径所在的区间 [下界, 上界)：把最后一个字节加一作为上界"""
+    return prefix, prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class HashIndex:
+    """
+    持久化的文件哈希索引。
+
+    以 (设备号, inode) 定位文件，只有 (大小, 修改时间) 也一致时才认为缓存有效，
+    否则视为文件已变化，重新计算后覆盖旧记录。用其他哈希算法算出的摘要同样视为失效。
+    """
+
+    def __init__(self, db_path, algorithm="md5", commit_every=1000):
+        self.db_path = db_path
+        self.algorithm = algorithm
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hash (
+                dev       INTEGER NOT NULL,
+                ino       INTEGER NOT NULL,
+                size      INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                path      TEXT    NOT NULL,
+                digest    TEXT    NOT NULL,
+                last_seen REAL    NOT NULL,
+                algorithm TEXT    NOT NULL DEFAULT 'md5',
+                PRIMARY KEY (dev, ino)
+            )
+            """
+        )
+        # 旧版本建立的索引没有 algorithm 列，其中的摘要都是 md5
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(file_hash)")]
+        if "algorithm" not in columns:
+            self.conn.execute("ALTER TABLE file_hash ADD COLUMN algorithm TEXT NOT NULL DEFAULT 'md5'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_file_hash_path ON file_hash (path)")
+        # 感知哈希指纹，与文件身份一起保存，图片未变化时不再重新解码
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_fingerprint (
+                dev       INTEGER NOT NULL,
+                ino       INTEGER NOT NULL,
+                size      INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                path      TEXT    NOT NULL,
+                dhash     INTEGER NOT NULL,
+                phash     INTEGER NOT NULL,
+                last_seen REAL    NOT NULL,
+                PRIMARY KEY (dev, ino)
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_image_fingerprint_path ON image_fingerprint (path)")
+        # 旧版本以文本保存路径，统一转换成字节串，与新记录的比较和排序保持一致
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            for table in ("file_hash", "image_fingerprint"):
+                self.conn.execute(f"UPDATE {table} SET path = CAST(path AS BLOB) WHERE typeof(path) = 'text'")
+            self.conn.execute("PRAGMA user_version = 1")
+        # 本次扫描见到的文件，只在本次连接中存在；compact 据此判断哪些记录已失效，不必再逐个 stat
+        self.conn.execute(
+            "CREATE TEMP TABLE seen (dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+            "PRIMARY KEY (dev, ino)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+        self.scanned_roots = []
+
+        self.commit_every = commit_every
+        self.pending = 0
+        self.now = time.time()
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.removed = 0
+
+    def _key(self, st):
+        return _sqlite_int(st.st_dev), _sqlite_int(st.st_ino)
+
+    def lookup(self, path, st):
+        """查询缓存的摘要，文件未变化时返回摘要，否则返回 None"""
+        dev, ino = self._key(st)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, path, digest, algorithm FROM file_hash WHERE dev = ? AND ino = ?",
+            (dev, ino),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        size, mtime_ns, old_path, digest, algorithm = row
+        if size != st.st_size or mtime_ns != st.st_mtime_ns or algorithm != self.algorithm:
+            # 同一个 inode 但内容可能已修改，旧记录作废
+            self.invalidated += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        path = _sqlite_path(path)
+        if old_path != path:
+            # 文件被移动或改名，更新路径
+            self.conn.execute(
+                "UPDATE file_hash SET path = ?, last_seen = ? WHERE dev = ? AND ino = ?",
+                (path, self.now, dev, ino),
+            )
+            self._maybe_commit()
+        return digest
+
+    def store(self, path, st, digest):
+        """写入（或覆盖）一个文件的摘要"""
+        dev, ino = self._key(st)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO file_hash (dev, ino, size, mtime_ns, path, digest, last_seen, algorithm) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (dev, ino, st.st_size, st.st_mtime_ns, _sqlite_path(path), digest, self.now, self.algorithm),
+        )
+        self._maybe_commit()
+
+    def lookup_fingerprint(self, path, st):
+        """查询图片的 (dHash, pHash)，文件未变化时返回指纹，否则返回 None"""
+        dev, ino = self._key(st)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, dhash, phash FROM image_fingerprint WHERE dev = ? AND ino = ?",
+            (dev, ino),
+        ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            if row is not None:
+                self.invalidated += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        # 指纹为无符号 64 位，保存时按有符号整数存储
+        return row[2] & 0xFFFFFFFFFFFFFFFF, row[3] & 0xFFFFFFFFFFFFFFFF
+
+    def store_fingerprint(self, path, st, fingerprint):
+        dev, ino = self._key(st)
+        d_hash, p_hash = fingerprint
+        self.conn.execute(
+            "INSERT OR REPLACE INTO image_fingerprint (dev, ino, size, mtime_ns, path, dhash, phash, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (dev, ino, st.st_size, st.st_mtime_ns, _sqlite_path(path), _sqlite_int(d_hash), _sqlite_int(p_hash),
+             self.now),
+        )
+        self._maybe_commit()
+
+    def mark_seen(self, st):
+        """记录扫描时见到的文件（设备号、inode、大小、修改时间）"""
+        dev, ino = self._key(st)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO temp.seen (dev, ino, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (dev, ino, st.st_size, st.st_mtime_ns),
+        )
+
+    def mark_scanned(self, root_dir):
+        """root_dir 已完整扫描一遍，其中的文件都已经过 mark_seen，之后可以 compact"""
+        self.scanned_roots.append(os.path.abspath(root_dir))
+
+    def compact(self):
+        """
+        清理已完整扫描过的根目录下失效的记录：本次扫描没有见到该 (设备号, inode)，
+        或者大小、修改时间已经不同。只比较扫描结果，不再访问文件系统。
+        删除记录后空闲页超过 VACUUM_FREE_RATIO 时才执行 VACUUM 回收空间。
+        """
+        removed = 0
+        for root_dir in self.scanned_roots:
+            prefix = _sqlite_path(os.path.join(root_dir, ""))
+            for table in ("file_hash", "image_fingerprint"):
+                cur = self.conn.execute(
+                    f"DELETE FROM {table} WHERE path >= ? AND path < ? AND NOT EXISTS ("
+                    f"SELECT 1 FROM temp.seen s WHERE s.dev = {table}.dev AND s.ino = {table}.ino "
+                    f"AND s.size = {table}.size AND s.mtime_ns = {table}.mtime_ns)",
+                    _prefix_range(prefix),
+                )
+                removed += cur.rowcount
+        self.scanned_roots = []
+
+        if removed:
+            self.conn.commit()
+            self.removed += removed
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if page_count and free_pages / page_count > VACUUM_FREE_RATIO:
+                self.conn.execute("VACUUM")
+        return removed
+
+    def _maybe_commit(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+    def stats_text(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return (
+            f"哈希索引：命中 {self.hits}，未命中 {self.misses}（其中失效 {self.invalidated}），"
+            f"命中率 {rate:.1f}%，清理 {self.removed} 条"
+        )
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
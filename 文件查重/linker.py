@@ -0,0 +1,104 @@
+import os
+import shutil
+
+from file_compare import compare_files_lockstep
+
+# Linux 的 FICLONE ioctl：让两个文件共享同一份数据块（Btrfs、XFS、bcachefs 等支持）
+FICLONE = 0x40049409
+
+
+def reflink_file(source, target):
+    """以写时复制方式把 source 克隆到新文件 target，文件系统不支持时抛出 OSError"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("当前系统不支持 reflink")
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def replace_with_link(keep, duplicate, method="auto"):
+    """
+    用指向 keep 的链接原地替换 duplicate，返回实际使用的方式（"reflink" 或 "hardlink"）。
+    先在同目录创建临时文件，成功后用 os.replace 原子替换，失败时 duplicate 保持原样。
+    method 为 "auto" 时优先 reflink（写时复制，修改其中一个不影响另一个），不支持时退回硬链接。
+    """
+    temp_path = f"{duplicate}.dedup_tmp"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+
+    used = None
+    if method in ("auto", "reflink"):
+        try:
+            reflink_file(keep, temp_path)
+            # reflink 生成的是新文件，保留原重复文件的时间戳和权限
+            shutil.copystat(duplicate, temp_path)
+            used = "reflink"
+        except OSError:
+            if method == "reflink":
+                raise
+    if used is None:
+        os.link(keep, temp_path)
+        used = "hardlink"
+
+    try:
+        os.replace(temp_path, duplicate)
+    except OSError:
+        os.remove(temp_path)
+        raise
+    return used
+
+
+def _check_unchanged(path, st, expected):
+    """与扫描时的记录比较大小和修改时间，文件在查重后被修改过时抛出 OSError"""
+    if expected is None:
+        return
+    if st.st_size != expected.st_size or st.st_mtime_ns != expected.st_mtime_ns:
+        raise OSError(f"文件在查重后发生了变化：{path}")
+
+
+def link_duplicates(duplicate_groups, method="auto", entries=None):
+    """
+    把每组除第一个以外的文件替换为指向第一个文件的链接。
+    entries 为扫描时的 {路径: FileEntry}，传入时大小或修改时间与扫描时不同的文件不做替换；
+    替换前还会逐字节确认内容相同。
+    返回统计 {"reflink": 数量, "hardlink": 数量, "failed": 数量, "reclaimed": 回收字节数}。
+    """
+    entries = entries or {}
+    stats = {"reflink": 0, "hardlink": 0, "failed": 0, "reclaimed": 0}
+    for group in duplicate_groups:
+        keep = group[0]
+        try:
+            keep_st = os.stat(keep)
+            _check_unchanged(keep, keep_st, entries.get(keep))
+        except OSError as e:
+            stats["failed"] += len(group) - 1
+            print(f"保留的文件无法使用，跳过整组：{keep}（{e}）")
+            continue
+        for duplicate in group[1:]:
+            try:
+                dup_st = os.stat(duplicate)
+                _check_unchanged(duplicate, dup_st, entries.get(duplicate))
+                if dup_st.st_size != keep_st.st_size:
+                    raise OSError("文件大小在查重后发生了变化")
+                if dup_st.st_dev != keep_st.st_dev:
+                    raise OSError("文件不在同一个卷上，无法链接")
+                if not compare_files_lockstep(keep, [duplicate])[0]:
+                    raise OSError("文件内容与保留的文件不同")
+                used = replace_with_link(keep, duplicate, method)
+            except OSError as e:
+                stats["failed"] += 1
+                print(f"替换失败：{duplicate}（{e}）")
+                continue
+
+            stats[used] += 1
+            # 原文件没有其他硬链接时，它占用的空间才会真正释放
+            if dup_st.st_nlink <= 1:
+                stats["reclaimed"] += dup_st.st_size
+    return stats
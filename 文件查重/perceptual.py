@@ -0,0 +1,131 @@
+import numpy as np
+from PIL import Image
+
+# 能够计算感知哈希的图片扩展名
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+
+PHASH_SIZE = 32   # pHash 先缩放到 32x32 再做 DCT
+HASH_SIZE = 8     # 取 8x8 低频系数，得到 64 位指纹
+
+
+def _dct_matrix(n):
+    """生成 n 阶 DCT-II 变换矩阵，二维 DCT 即 M @ X @ M.T"""
+    k = np.arange(n).reshape(-1, 1)
+    i = np.arange(n).reshape(1, -1)
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] = np.sqrt(1.0 / n)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def _bits_to_int(bits):
+    """把布尔数组打包成一个 64 位整数"""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def load_gray(file_path):
+    """解码图片为灰度图。JPEG 使用 draft 模式按 1/2~1/8 缩小解码，速度快很多"""
+    with Image.open(file_path) as img:
+        img.draft("L", (PHASH_SIZE * 2, PHASH_SIZE * 2))
+        return img.convert("L")
+
+
+def dhash(gray):
+    """差值哈希：比较相邻像素亮度"""
+    pixels = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(gray):
+    """感知哈希：对 32x32 灰度图做 DCT，取左上角低频系数与中位数比较"""
+    pixels = np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    low_freq = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # 直流分量只反映整体亮度，不参与中位数计算
+    median = np.median(low_freq.ravel()[1:])
+    return _bits_to_int(low_freq > median)
+
+
+def compute_fingerprints(file_path):
+    """计算图片的 (dHash, pHash)，无法解码时返回 None"""
+    try:
+        gray = load_gray(file_path)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return dhash(gray), phash(gray)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    以汉明距离为度量的 BK 树，用于查找距离不超过阈值的指纹，避免两两比较。
+    每个节点为 [指纹, 条目列表, {距离: 子节点}]，相同指纹的条目共享一个节点。
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, fingerprint, item):
+        if self.root is None:
+            self.root = [fingerprint, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(fingerprint, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [fingerprint, [item], {}]
+                return
+            node = child
+
+    def search(self, fingerprint, threshold):
+        """返回所有距离不超过 threshold 的 (距离, 条目)"""
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(fingerprint, node[0])
+            if distance <= threshold:
+                results.extend((distance, item) for item in node[1])
+            # 三角不等式：只有距离在 [d - t, d + t] 内的子树可能包含结果
+            for child_distance, child in node[2].items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return results
+
+
+def group_similar(fingerprints, phash_threshold, dhash_threshold):
+    """
+    把相似图片聚成组。fingerprints 为 {路径: (dHash, pHash)}。
+    用 BK 树按 pHash 找候选，再用 dHash 复核，最后用并查集合并成组。
+    """
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    tree = BKTree()
+    for path, (d_hash, p_hash) in fingerprints.items():
+        parent[path] = path
+        # 先查询再插入，每一对只会被比较一次
+        for _, other in tree.search(p_hash, phash_threshold):
+            if hamming(d_hash, fingerprints[other][0]) <= dhash_threshold:
+                parent[find(other)] = find(path)
+        tree.add(p_hash, path)
+
+    groups = {}
+    for path in fingerprints:
+        groups.setdefault(find(path), []).append(path)
+    return [group for group in groups.values() if len(group) > 1]
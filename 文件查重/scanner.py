@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+from collections import deque, namedtuple
+
+# 扫描得到的文件记录。字段名与 os.stat_result 保持一致，可以直接传给 HashIndex
+FileEntry = namedtuple("FileEntry", "path st_size st_ctime st_mtime_ns st_dev st_ino")
+
+_DONE = object()
+
+
+class _Walker:
+    """
+    多线程目录遍历器，基于 os.scandir，使用工作窃取队列分配子目录。
+
+    每个线程有自己的双端队列：新发现的子目录压入自己队列的尾部并优先处理（深度优先，局部性好），
+    自己的队列空了就从其他线程队列的头部窃取较早入队的目录。
+    DirEntry 自带的 stat 缓存让每个文件最多只 stat 一次（Linux 上 is_dir 也不需要额外 stat）。
+    """
+
+    def __init__(self, root_dir, skip_dirs, workers, follow_symlinks, batch_size):
+        self.root_dir = root_dir
+        self.skip_dirs = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+        self.workers = max(workers, 1)
+        self.follow_symlinks = follow_symlinks
+        self.batch_size = batch_size
+
+        self.deques = [deque() for _ in range(self.workers)]
+        self.pending = 0  # 已入队但尚未处理完的目录数
+        self.cond = threading.Condition()
+        self.results = queue.Queue(maxsize=self.workers * 4)
+
+        # 已进入过的目录 (设备号, inode)，用于识别符号链接/挂载点造成的循环
+        self.visited = set()
+        self.visited_lock = threading.Lock()
+
+        # Windows 上 DirEntry.stat() 的 st_dev/st_ino 为 0，用根目录的卷序列号代替设备号
+        self.root_dev = os.stat(root_dir).st_dev
+
+    def _push(self, worker_id, directory):
+        with self.cond:
+            self.pending += 1
+            self.deques[worker_id].append(directory)
+            self.cond.notify()
+
+    def _take(self, worker_id):
+        """取一个待处理目录，没有可做的工作且全部完成时返回 None"""
+        while True:
+            try:
+                return self.deques[worker_id].pop()
+            except IndexError:
+                pass
+            for offset in range(1, self.workers):
+                victim = self.deques[(worker_id + offset) % self.workers]
+                try:
+                    return victim.popleft()
+                except IndexError:
+                    continue
+            with self.cond:
+                if self.pending == 0:
+                    self.cond.notify_all()
+                    return None
+                self.cond.wait(0.05)
+
+    def _enter(self, directory):
+        """记录目录身份，已进入过则返回 False"""
+        try:
+            st = os.stat(directory)
+        except OSError:
+            return False
+        key = (st.st_dev, st.st_ino)
+        with self.visited_lock:
+            if key in self.visited:
+                return False
+            self.visited.add(key)
+        return True
+
+    def _scan_dir(self, worker_id, directory, batch):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            if os.path.normcase(entry.path) in self.skip_dirs:
+                                continue
+                            # 跟随链接时用真实目录身份识别循环（链接指向祖先目录会无限递归）
+                            if self.follow_symlinks and not self._enter(entry.path):
+                                continue
+                            self._push(worker_id, entry.path)
+                        elif entry.is_file(follow_symlinks=self.follow_symlinks):
+                            st = entry.stat(follow_symlinks=self.follow_symlinks)
+                            dev, ino = st.st_dev, st.st_ino
+                            if dev == 0 and ino == 0:
+                                dev, ino = self.root_dev, entry.inode()
+                            batch.append(FileEntry(entry.path, st.st_size, st.st_ctime, st.st_mtime_ns, dev, ino))
+                            if len(batch) >= self.batch_size:
+                                self.results.put(batch[:])
+                                batch.clear()
+                    except OSError:
+                        # 文件在扫描过程中被删除或无权限访问，跳过
+                        continue
+        except OSError:
+            pass
+
+    def _worker(self, worker_id):
+        batch = []
+        while True:
+            directory = self._take(worker_id)
+            if directory is None:
+                break
+            try:
+                self._scan_dir(worker_id, directory, batch)
+            finally:
+                with self.cond:
+                    self.pending -= 1
+                    if self.pending == 0:
+                        self.cond.notify_all()
+        if batch:
+            self.results.put(batch)
+        self.results.put(_DONE)
+
+    def __iter__(self):
+        if self.follow_symlinks:
+            self._enter(self.root_dir)
+        self._push(0, self.root_dir)
+        threads = [
+            threading.Thread(target=self._worker, args=(i,), daemon=True, name=f"scan-{i}")
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        finished = 0
+        while finished < self.workers:
+            item = self.results.get()
+            if item is _DONE:
+                finished += 1
+                continue
+            yield from item
+
+        for thread in threads:
+            thread.join()
+
+
+def scan_files(root_dir, skip_dirs=(), workers=8, follow_symlinks=False, batch_size=512):
+    """
+    并行遍历 root_dir，逐个产出 FileEntry。
+    skip_dirs 中的目录（如查重结果输出目录）整个跳过；follow_symlinks 为 True 时跟随目录链接，
+    并通过 (设备号, inode) 去重避免链接循环。
+    """
+    return iter(_Walker(root_dir, skip_dirs, workers, follow_symlinks, batch_size))
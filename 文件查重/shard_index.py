@@ -0,0 +1,115 @@
+import gzip
+import heapq
+import os
+import tempfile
+
+# 索引分片格式：gzip 压缩的文本，每行 "大小(16位十六进制)\t摘要\t主机\t路径"，按整行字典序排序。
+# 大小用定长十六进制，字典序即数值顺序，合并时直接比较整行字符串即可。
+SHARD_HEADER = "# dedup-index v1\n"
+
+
+def _escape(path):
+    return path.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _unescape(text):
+    result = []
+    chars = iter(text)
+    for ch in chars:
+        if ch == "\\":
+            nxt = next(chars, "")
+            result.append({"t": "\t", "n": "\n"}.get(nxt, nxt))
+        else:
+            result.append(ch)
+    return "".join(result)
+
+
+def format_record(size, digest, host, path):
+    return f"{size:016x}\t{digest}\t{host}\t{_escape(path)}\n"
+
+
+def parse_record(line):
+    """解析一行记录，返回 (大小, 摘要, 主机, 路径)"""
+    size, digest, host, path = line.rstrip("\n").split("\t", 3)
+    return int(size, 16), digest, host, _unescape(path)
+
+
+def _read_lines(path):
+    """逐行读取分片（或排序过程中的临时分段），跳过文件头"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="\n") as f:
+        for line in f:
+            if not line.startswith("#"):
+                yield line
+
+
+def merge_sorted(paths):
+    """对多个已排序的分片做流式 k 路归并，内存中只保留每个分片的当前行"""
+    return heapq.merge(*(_read_lines(path) for path in paths))
+
+
+def write_sorted_shard(records, shard_path, host, run_size=500000, work_dir=None):
+    """
+    把 (大小, 摘要, 路径) 记录写成排序好的分片。
+    记录先按 run_size 条一段在内存中排序写入临时文件，最后 k 路归并成一个 gzip 分片，
+    内存占用只与 run_size 有关。返回写入的记录数。
+    """
+    temp_dir = tempfile.mkdtemp(prefix="dedup_shard_", dir=work_dir)
+    runs = []
+    buffer = []
+    count = 0
+
+    def flush():
+        buffer.sort()
+        run_path = os.path.join(temp_dir, f"run_{len(runs):05d}.txt")
+        with open(run_path, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(buffer)
+        runs.append(run_path)
+        buffer.clear()
+
+    try:
+        for size, digest, path in records:
+            buffer.append(format_record(size, digest, host, path))
+            count += 1
+            if len(buffer) >= run_size:
+                flush()
+        if buffer:
+            flush()
+
+        with gzip.open(shard_path, "wt", encoding="utf-8", newline="\n") as out:
+            out.write(SHARD_HEADER)
+            out.writelines(merge_sorted(runs))
+    finally:
+        for run_path in runs:
+            os.remove(run_path)
+        os.rmdir(temp_dir)
+    return count
+
+
+def merge_shards(shard_paths, merged_path=None):
+    """
+    流式合并多个分片，产出跨分片的重复组 [(大小, 摘要, [(主机, 路径), ...]), ...]。
+    指定 merged_path 时同时写出合并后的分片，它本身也可以再次参与合并。
+    """
+    out = None
+    if merged_path:
+        out = gzip.open(merged_path, "wt", encoding="utf-8", newline="\n")
+        out.write(SHARD_HEADER)
+    try:
+        current_key = None
+        members = []
+        for line in merge_sorted(shard_paths):
+            if out is not None:
+                out.write(line)
+            size, digest, host, path = parse_record(line)
+            if (size, digest) != current_key:
+                if len(members) > 1:
+                    yield current_key[0], current_key[1], members
+                current_key = (size, digest)
+                members = []
+            members.append((host, path))
+        if len(members) > 1:
+            yield current_key[0], current_key[1], members
+    finally:
+        if out is not None:
+            out.close()
@@ -0,0 +1,110 @@
+import csv
+import os
+import shutil
+import tempfile
+
+from scanner import FileEntry
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+class SizeGroupStore:
+    """
+    外存分组。
+
+    扫描记录顺序追加到磁盘上的 CSV 溢出文件，写入时只占用一个缓冲区；
+    扫描结束后由 DuckDB 在磁盘上完成 GROUP BY 和排序（超过内存上限时自动溢出到临时目录），
+    再按大小顺序把同大小的候选组分批流式读回。整个过程的内存占用与目录树大小无关。
+    """
+
+    def __init__(self, work_dir=None, memory_limit="512MB"):
+        import duckdb
+
+        self.work_dir = tempfile.mkdtemp(prefix="dedup_", dir=work_dir)
+        self.spill_path = os.path.join(self.work_dir, "entries.csv")
+        self.spill_file = open(self.spill_path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.spill_file)
+        self.total_entries = 0
+        self.linked_files = 0
+
+        self.conn = duckdb.connect(os.path.join(self.work_dir, "groups.duckdb"))
+        self.conn.execute(f"SET memory_limit = {_sql_string(memory_limit)}")
+        self.conn.execute(f"SET temp_directory = {_sql_string(os.path.join(self.work_dir, 'tmp'))}")
+        self.conn.execute("SET preserve_insertion_order = false")
+
+    def add(self, entry):
+        self.writer.writerow(entry)
+        self.total_entries += 1
+
+    def finish(self):
+        """
+        扫描结束后做外部分组，返回候选文件数。
+        共享同一 inode 的硬链接只保留一条记录，再只保留大小重复的记录。
+        """
+        self.spill_file.close()
+        self.conn.execute(
+            f"""
+            CREATE TABLE files AS
+            SELECT * FROM read_csv({_sql_string(self.spill_path)},
+                header = false, quote = '"', escape = '"',
+                columns = {{'path': 'VARCHAR', 'st_size': 'BIGINT', 'st_ctime': 'DOUBLE',
+                            'st_mtime_ns': 'BIGINT', 'st_dev': 'UBIGINT', 'st_ino': 'UBIGINT'}})
+            """
+        )
+        os.remove(self.spill_path)
+        self.conn.execute(
+            """
+            CREATE TABLE unique_files AS
+            SELECT * FROM files
+            QUALIFY row_number() OVER (PARTITION BY st_dev, st_ino ORDER BY path) = 1
+            """
+        )
+        self.linked_files = self.total_entries - self.conn.execute("SELECT count(*) FROM unique_files").fetchone()[0]
+        self.conn.execute("DROP TABLE files")
+        self.conn.execute(
+            """
+            CREATE TABLE candidates AS
+            SELECT f.* FROM unique_files f
+            JOIN (SELECT st_size FROM unique_files GROUP BY st_size HAVING count(*) > 1) s USING (st_size)
+            """
+        )
+        self.conn.execute("DROP TABLE unique_files")
+        return self.conn.execute("SELECT count(*) FROM candidates").fetchone()[0]
+
+    def iter_batches(self, max_files=100000, fetch_size=10000):
+        """
+        按大小顺序流式读回候选组，每批为 [(文件大小, FileEntry 列表), ...]，
+        一批最多约 max_files 个文件（同一大小的组不会被拆开）。
+        """
+        cursor = self.conn.execute(
+            "SELECT path, st_size, st_ctime, st_mtime_ns, st_dev, st_ino FROM candidates ORDER BY st_size"
+        )
+        batch = []
+        batch_files = 0
+        current_size = None
+        current_group = []
+        while rows := cursor.fetchmany(fetch_size):
+            for row in rows:
+                entry = FileEntry(*row)
+                if entry.st_size != current_size and current_group:
+                    batch.append((current_size, current_group))
+                    batch_files += len(current_group)
+                    current_group = []
+                    if batch_files >= max_files:
+                        yield batch
+                        batch = []
+                        batch_files = 0
+                current_size = entry.st_size
+                current_group.append(entry)
+        if current_group:
+            batch.append((current_size, current_group))
+        if batch:
+            yield batch
+
+    def close(self):
+        if not self.spill_file.closed:
+            self.spill_file.close()
+        self.conn.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
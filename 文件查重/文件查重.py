@@ -1,99 +1,536 @@
 import os
-import hashlib
+import sys
 import shutil
+import socket
 
+# 共用的哈希模块在 Hash 目录下
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Hash"))
+from hashcore import hash_file, hash_ranges
 
-def calculate_file_hash(file_path, chunk_size=8192):
+from file_compare import compare_files_lockstep
+from hash_engine import HashEngine
+from hash_index import HashIndex
+from linker import link_duplicates
+from scanner import scan_files
+from shard_index import merge_shards, write_sorted_shard
+
+# 哈希算法：md5 与旧版本结果兼容，也可选 blake2b、sha256（可运行 Hash/hashcore.py 测试本机哪个最快；
+# 切换后索引中旧算法的记录会自动失效）
+HASH_ALGORITHM = "md5"
+
+# 持久化哈希索引文件，放在脚本所在目录，下次运行时未变化的文件直接复用摘要
+HASH_INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hash_index.db")
+
+# 分阶段过滤：同大小的文件先比较头部、尾部、中间抽样块，仍然相同的才计算完整哈希
+# 任意一项设为 0 即跳过该阶段；小于 PARTIAL_HASH_MIN_SIZE 的文件直接计算完整哈希
+HEAD_SAMPLE_SIZE = 64 * 1024
+TAIL_SAMPLE_SIZE = 64 * 1024
+MIDDLE_SAMPLE_COUNT = 4
+MIDDLE_SAMPLE_SIZE = 64 * 1024
+PARTIAL_HASH_MIN_SIZE = 1024 * 1024
+
+# 同大小候选组只剩不超过 DIRECT_COMPARE_MAX_FILES 个文件时不再计算哈希，
+# 而是逐块同步读取直接比较内容，遇到第一个不同的块立即停止（设为 0 则总是计算完整哈希）
+DIRECT_COMPARE_MAX_FILES = 2
+DIRECT_COMPARE_CHUNK_SIZE = 1024 * 1024
+
+# 并行哈希：按底层块设备分别限制同时读取的文件数
+SSD_READERS = 8      # 固态硬盘
+HDD_READERS = 2      # 机械硬盘
+DEFAULT_READERS = 4  # 无法识别设备类型时（如 Windows、网络共享）
+
+# 目录扫描：并行遍历的线程数，以及是否跟随目录符号链接（跟随时会自动识别链接循环）
+SCAN_WORKERS = 8
+FOLLOW_SYMLINKS = False
+
+# 外存模式：千万级文件的目录树设为 True，扫描记录写入磁盘由 DuckDB 分组，内存占用有上限
+OUT_OF_CORE = False
+OUT_OF_CORE_WORK_DIR = None          # 临时文件目录，None 为系统临时目录
+OUT_OF_CORE_MEMORY_LIMIT = "512MB"   # DuckDB 内存上限，超出部分溢出到磁盘
+OUT_OF_CORE_BATCH_FILES = 100000     # 每批流回哈希阶段的文件数
+
+# 链接去重方式："auto" 优先 reflink（写时复制）、不支持时用硬链接；也可指定 "reflink" 或 "hardlink"
+LINK_METHOD = "auto"
+
+# 跨主机索引：导出的分片和合并结果存放目录，导出时每批哈希的文件数
+INDEX_EXPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_EXPORT_BATCH = 10000
+
+# 查重结果输出目录名，扫描时整个跳过
+DUPLICATES_DIR_NAME = '待处理重复文件'
+
+# 相似图片模式：pHash 与 dHash 的汉明距离都不超过阈值时视为同一张照片
+PHASH_THRESHOLD = 10
+DHASH_THRESHOLD = 12
+
+# 块级查重分析：只对不小于该大小的文件做内容定义分块，列出共享数据最多的文件对数量
+CHUNK_ANALYSIS_MIN_SIZE = 1024 * 1024
+CHUNK_ANALYSIS_TOP_PAIRS = 20
+
+
+def calculate_file_hash(file_path):
     """计算文件的哈希值"""
-    hasher = hashlib.md5()
-    with open(file_path, 'rb') as f:
-        while chunk := f.read(chunk_size):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+    return hash_file(file_path, HASH_ALGORITHM)
+
+
+def calculate_sample_hash(file_path, ranges):
+    """只读取指定的 (偏移, 长度) 区间并计算哈希"""
+    return hash_ranges(file_path, ranges, HASH_ALGORITHM)
+
+
+def sample_stages(file_size):
+    """生成分阶段过滤的抽样区间，返回 [(阶段名, 区间列表), ...]"""
+    stages = []
+    if HEAD_SAMPLE_SIZE > 0:
+        stages.append(("头部", [(0, HEAD_SAMPLE_SIZE)]))
+    if TAIL_SAMPLE_SIZE > 0:
+        stages.append(("尾部", [(file_size - TAIL_SAMPLE_SIZE, TAIL_SAMPLE_SIZE)]))
+    if MIDDLE_SAMPLE_COUNT > 0 and MIDDLE_SAMPLE_SIZE > 0:
+        step = file_size // (MIDDLE_SAMPLE_COUNT + 1)
+        ranges = [(step * (i + 1), MIDDLE_SAMPLE_SIZE) for i in range(MIDDLE_SAMPLE_COUNT)]
+        stages.append(("中间", ranges))
+    return stages
+
+
+def filter_by_samples(candidates, stage_stats, engine):
+    """
+    逐阶段比较抽样哈希，把同大小的文件逐步细分，返回仍然互相冲突的候选组。
+    candidates 为 [(文件大小, FileEntry 列表), ...]，每个阶段把所有候选组的文件一起交给引擎并行读取。
+    被某个阶段排除的文件不再读取剩余内容，节省的字节数记在该阶段名下。
+    """
+    read_per_file = {}  # 文件大小 -> 每个文件已读取的抽样字节数
+    stage_names = [name for name, _ in sample_stages(PARTIAL_HASH_MIN_SIZE)]
+    for stage_name in stage_names:
+        tasks = []
+        stage_ranges = {}
+        for size, group in candidates:
+            if size < PARTIAL_HASH_MIN_SIZE:
+                continue
+            ranges = stage_ranges.setdefault(size, dict(sample_stages(size))[stage_name])
+            stage_bytes = sum(length for _, length in ranges)
+            tasks.extend((entry.path, stage_bytes, (ranges,), entry.st_dev) for entry in group)
+        if not tasks:
+            break
+
+        stats = stage_stats.setdefault(stage_name, {"files": 0, "read": 0, "avoided": 0})
+        sample_hashes = dict(engine.map(calculate_sample_hash, tasks))
+        stats["read"] += sum(task[1] for task in tasks)
+
+        next_candidates = []
+        for size, group in candidates:
+            if size not in stage_ranges:
+                next_candidates.append((size, group))
+                continue
+            read_per_file[size] = read_per_file.get(size, 0) + sum(length for _, length in stage_ranges[size])
+            sample_map = {}
+            for entry in group:
+                sample_map.setdefault(sample_hashes[entry.path], []).append(entry)
+            for sub_group in sample_map.values():
+                if len(sub_group) > 1:
+                    next_candidates.append((size, sub_group))
+                else:
+                    stats["files"] += 1
+                    stats["avoided"] += max(size - read_per_file[size], 0)
+        candidates = next_candidates
+    return candidates
+
+
+def format_size(num_bytes):
+    """把字节数格式化成易读的单位"""
+    if num_bytes < 1024:
+        return f"{num_bytes} B"
+    for unit in ("KB", "MB", "GB", "TB"):
+        num_bytes /= 1024
+        if num_bytes < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}"
+
+
+def print_stage_report(stage_stats):
+    """打印各过滤阶段排除的文件数和避免读取的字节数"""
+    if not stage_stats:
+        return
+    print("分阶段过滤统计：")
+    for stage_name, stats in stage_stats.items():
+        print(f"  {stage_name}：读取 {format_size(stats['read'])}，"
+              f"排除 {stats['files']} 个文件，避免读取 {format_size(stats['avoided'])}")
+
+
+def scan_roots(root_dirs, hash_index=None, skip_dirs=None):
+    """
+    依次扫描多个根目录，跳过每个根目录下的查重结果输出目录。
+    传入 hash_index 时记录见到的每个文件；完整扫描过的根目录在结束时由 compact 清理其中的失效记录。
+    """
+    if skip_dirs is None:
+        skip_dirs = [os.path.join(root_dir, DUPLICATES_DIR_NAME) for root_dir in root_dirs]
+    for root_dir in root_dirs:
+        for entry in scan_files(root_dir, skip_dirs, SCAN_WORKERS, FOLLOW_SYMLINKS):
+            if hash_index is not None:
+                hash_index.mark_seen(entry)
+            yield entry
+        if hash_index is not None:
+            hash_index.mark_scanned(root_dir)
 
 
-def group_files_by_size(root_dir):
-    """按文件大小分组"""
+def group_files_by_size(root_dirs, hash_index=None):
+    """
+    按文件大小分组，值为 FileEntry 列表，扫描时取得的大小、创建时间、inode 一路带到后续步骤。
+    传入多个根目录时合并成一张表，不同根目录之间的重复文件也能找出来。
+    """
     size_map = {}
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            file_size = os.path.getsize(file_path)
-            if file_size not in size_map:
-                size_map[file_size] = []
-            size_map[file_size].append(file_path)
+    seen_inodes = set()
+    linked_files = 0
+    for entry in scan_roots(root_dirs, hash_index):
+        # 已经是同一个 inode 的硬链接，内容必然相同，只保留一个参与比较
+        inode = (entry.st_dev, entry.st_ino)
+        if inode in seen_inodes:
+            linked_files += 1
+            continue
+        seen_inodes.add(inode)
+        if entry.st_size not in size_map:
+            size_map[entry.st_size] = []
+        size_map[entry.st_size].append(entry)
+    if linked_files:
+        print(f"跳过 {linked_files} 个已与其他文件共享 inode 的硬链接")
     return size_map
 
 
-def process_duplicates(size_map, duplicates_dir):
-    """处理重复文件"""
+def process_duplicates(size_map, duplicates_dir, hash_index=None, root_dirs=None):
+    """
+    处理重复文件，传入 hash_index 时未变化的文件直接使用索引中的摘要。
+    root_dirs 为本次扫描的所有根目录，移动时每个重复文件放入它所在根目录的输出目录。
+    """
     if not os.path.exists(duplicates_dir):
         os.makedirs(duplicates_dir)
-    
-    duplicate_groups = []
+
+    buckets = [(size, files) for size, files in size_map.items() if len(files) > 1]
     # 统计总的需要计算哈希的文件数量
-    total_files = sum(len(files) for files in size_map.values() if len(files) > 1)
+    total_files = sum(len(files) for _, files in buckets)
+    duplicate_groups, group_entries = find_duplicate_groups([buckets], total_files, hash_index)
+
+    # 判断是否有重复文件
+    if not duplicate_groups:
+        print("Hash检测完成 无重复文件")
+        return []  # 返回空列表，退出函数
+
+    confirm_and_move(duplicate_groups, duplicates_dir, allow_link=True, root_dirs=root_dirs, entries=group_entries)
+    return duplicate_groups
+
+
+def process_duplicates_out_of_core(root_dirs, duplicates_dir, hash_index=None):
+    """外存模式：扫描记录写入磁盘，由 DuckDB 做外部分组后分批流回哈希阶段，内存占用有上限"""
+    from size_store import SizeGroupStore
+
+    if not os.path.exists(duplicates_dir):
+        os.makedirs(duplicates_dir)
+
+    store = SizeGroupStore(OUT_OF_CORE_WORK_DIR, OUT_OF_CORE_MEMORY_LIMIT)
+    try:
+        for entry in scan_roots(root_dirs, hash_index):
+            store.add(entry)
+        print(f"扫描完成，共 {store.total_entries} 个文件，正在按大小分组...")
+        total_files = store.finish()
+        if store.linked_files:
+            print(f"跳过 {store.linked_files} 个已与其他文件共享 inode 的硬链接")
+        duplicate_groups, group_entries = find_duplicate_groups(
+            store.iter_batches(OUT_OF_CORE_BATCH_FILES), total_files, hash_index
+        )
+    finally:
+        store.close()
+
+    if not duplicate_groups:
+        print("Hash检测完成 无重复文件")
+        return []
+
+    confirm_and_move(duplicate_groups, duplicates_dir, allow_link=True, root_dirs=root_dirs, entries=group_entries)
+    return duplicate_groups
+
+
+def find_duplicate_groups(bucket_batches, total_files, hash_index=None):
+    """
+    对分批给出的同大小候选组计算哈希，返回 (重复文件组, {路径: FileEntry})，
+    每组为路径列表，第一个为保留的文件；FileEntry 只包含重复组中的文件，替换为链接前用来确认文件未被修改。
+    bucket_batches 的每一批为 [(文件大小, FileEntry 列表), ...]，批与批之间互不相关，
+    外存模式下每批处理完即可释放。
+    """
+    duplicate_groups = []
+    group_entries = {}
+    stage_stats = {}  # 各过滤阶段的统计
     processed_files = 0  # 已处理文件计数
+    engine = HashEngine(SSD_READERS, HDD_READERS, DEFAULT_READERS)
+    try:
+        for buckets in bucket_batches:
+            groups, processed_files = hash_bucket_batch(
+                buckets, hash_index, engine, stage_stats, processed_files, total_files
+            )
+            for group in groups:
+                duplicate_groups.append([entry.path for entry in group])
+                group_entries.update((entry.path, entry) for entry in group)
+    finally:
+        engine.shutdown()
+    engine.report_progress(total_files, total_files, force=True)
 
-    # 生成重复文件树状结构文本并提示用户确认
-    for size,files in size_map.items():
-        if len(files) < 2:
-            continue  # 跳过只有一个文件的分组
-        
+    print_stage_report(stage_stats)
+    return duplicate_groups, group_entries
+
+
+def hash_bucket_batch(buckets, hash_index, engine, stage_stats, processed_files, total_files):
+    """处理一批同大小候选组，返回 (重复文件组（FileEntry 列表）, 更新后的已处理文件数)"""
+    duplicate_groups = []
+
+    # 先查哈希索引，整组都命中的分组无需再读取任何内容
+    cached = {}
+    if hash_index is not None:
+        for size, files in buckets:
+            for entry in files:
+                digest = hash_index.lookup(entry.path, entry)
+                if digest is not None:
+                    cached[entry.path] = digest
+
+    def fully_cached(files):
+        return all(entry.path in cached for entry in files)
+
+    # 未完全命中的分组先做分阶段过滤，再并行计算完整哈希
+    digests = dict(cached)
+    batch_files = sum(len(files) for _, files in buckets)
+    uncached = [(size, files) for size, files in buckets if not fully_cached(files)]
+    remaining = filter_by_samples(uncached, stage_stats, engine)
+    # 过滤后细分出的子组可能已全部命中索引（其他成员被排除了），这样的子组与整组命中的一样直接用摘要分组；
+    # 每个子组只归入一类：全部命中、直接比较、计算完整哈希
+    candidates = [(size, files) for size, files in buckets if fully_cached(files)]
+    direct = []
+    for size, files in remaining:
+        if not fully_cached(files) and len(files) <= DIRECT_COMPARE_MAX_FILES:
+            direct.append((size, files))
+        else:
+            candidates.append((size, files))
+    processed_files += batch_files - sum(len(files) for _, files in candidates + direct)
+
+    # 只剩少数文件的组直接逐块比较，遇到不同的块就停止，不再读完整个文件
+    if direct:
+        duplicate_groups.extend(compare_small_groups(direct, engine, stage_stats, hash_index))
+        processed_files += sum(len(files) for _, files in direct)
+        engine.report_progress(processed_files, total_files)
+
+    entries = {}
+    tasks = []
+    for size, files in candidates:
+        for entry in files:
+            if entry.path not in cached:
+                entries[entry.path] = entry
+                tasks.append((entry.path, size, (), entry.st_dev))
+    for file, file_hash in engine.map(calculate_file_hash, tasks):
+        digests[file] = file_hash
+        if hash_index is not None:
+            hash_index.store(file, entries[file], file_hash)
+        # 更新处理进度
+        processed_files += 1
+        engine.report_progress(processed_files, total_files)
+    processed_files += sum(len(files) for _, files in candidates) - len(tasks)
+
+    for size, files in candidates:
         # 计算哈希值并分组
         hash_map = {}
-        for file in files:
-            file_hash = calculate_file_hash(file)
+        for entry in files:
+            file_hash = digests[entry.path]
             if file_hash not in hash_map:
                 hash_map[file_hash] = []
-            hash_map[file_hash].append(file)
+            hash_map[file_hash].append(entry)
 
-            # 更新处理进度
-            processed_files += 1
-            print(f"Hash已经处理({processed_files}/{total_files})")
-        
         # 生成重复文件树状结构文本
-        for file_list in hash_map.values():
-            if len(file_list) < 2:
+        for entry_list in hash_map.values():
+            if len(entry_list) < 2:
                 continue
 
+            # 按创建时间排序，保留最早创建的文件（创建时间在扫描时已取得，无需再次 stat）
+            entry_list.sort(key=lambda x: x.st_ctime)
+            duplicate_groups.append(entry_list)
+
+    return duplicate_groups, processed_files
+
+
+def compare_small_groups(groups, engine, stage_stats, hash_index=None):
+    """
+    并行地对每个小候选组做逐块比较，返回重复文件组（FileEntry 列表），读取与节省的字节数记入统计。
+    传入 hash_index 时比较的同时计算哈希，读完整个文件的（内容相同的）文件摘要写入索引。
+    """
+    stats = stage_stats.setdefault("逐块比较", {"files": 0, "read": 0, "avoided": 0})
+    algorithm = HASH_ALGORITHM if hash_index is not None else None
+    entries = {}
+    tasks = []
+    for size, files in groups:
+        for entry in files:
+            entries[entry.path] = entry
+        other_paths = [entry.path for entry in files[1:]]
+        tasks.append((files[0].path, 0, (other_paths, DIRECT_COMPARE_CHUNK_SIZE, algorithm), files[0].st_dev))
+
+    duplicate_groups = []
+    results = engine.map(compare_files_lockstep, tasks)
+    for (size, files), (_, (identical, bytes_read, digests)) in zip(groups, results):
+        engine.add_bytes(bytes_read)
+        stats["read"] += bytes_read
+        stats["avoided"] += size * len(files) - bytes_read
+        stats["files"] += len(files) - sum(len(group) for group in identical)
+        for path, digest in digests.items():
+            hash_index.store(path, entries[path], digest)
+        for group in identical:
             # 按创建时间排序，保留最早创建的文件
-            file_list.sort(key=lambda x: os.path.getctime(x))
-            duplicate_groups.append(file_list)
-    
-    # 判断是否有重复文件
-    if not duplicate_groups:
-        print("Hash检测完成 无重复文件")
-        return []  # 返回空列表，退出函数
+            duplicate_groups.append(sorted((entries[path] for path in group), key=lambda x: x.st_ctime))
+    return duplicate_groups
+
+
+def process_similar_images(root_dir, duplicates_dir, hash_index):
+    """相似图片查重：用感知哈希找出重新编码、缩放或去掉 EXIF 后的同一张照片"""
+    from perceptual import IMAGE_EXTENSIONS, compute_fingerprints, group_similar
+
+    if not os.path.exists(duplicates_dir):
+        os.makedirs(duplicates_dir)
+
+    # 收集图片，已经计算过指纹且未变化的直接从索引读取
+    fingerprints = {}
+    file_stats = {}
+    tasks = []
+    for entry in scan_roots([root_dir], hash_index, [duplicates_dir]):
+        if os.path.splitext(entry.path)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        file_stats[entry.path] = entry
+        fingerprint = hash_index.lookup_fingerprint(entry.path, entry)
+        if fingerprint is not None:
+            fingerprints[entry.path] = fingerprint
+        else:
+            tasks.append((entry.path, entry.st_size, (), entry.st_dev))
+
+    total_files = len(file_stats)
+    processed_files = len(fingerprints)
+    engine = HashEngine(SSD_READERS, HDD_READERS, DEFAULT_READERS)
+    try:
+        for file_path, fingerprint in engine.map(compute_fingerprints, tasks):
+            processed_files += 1
+            engine.report_progress(processed_files, total_files)
+            if fingerprint is None:
+                print(f"无法解码，跳过：{file_path}")
+                continue
+            fingerprints[file_path] = fingerprint
+            hash_index.store_fingerprint(file_path, file_stats[file_path], fingerprint)
+    finally:
+        engine.shutdown()
+    engine.report_progress(total_files, total_files, force=True)
+
+    similar_groups = group_similar(fingerprints, PHASH_THRESHOLD, DHASH_THRESHOLD)
+    if not similar_groups:
+        print("相似图片检测完成 无相似图片")
+        return []
+
+    # 保留文件最大的一张（通常画质最好），大小相同时保留最早创建的
+    for group in similar_groups:
+        group.sort(key=lambda x: (-file_stats[x].st_size, file_stats[x].st_ctime))
+
+    confirm_and_move(similar_groups, duplicates_dir, 'similar_tree.txt', "相似组")
+    return similar_groups
+
+
+def process_chunk_analysis(root_dirs):
+    """
+    块级查重分析：把大文件按内容定义分块，估算块级去重能节省多少空间（按目录、按文件对统计）。
+    只读取和统计，不移动任何文件。
+    """
+    from chunking import ChunkIndex, chunk_task, default_group
 
+    tasks = [(entry.path, entry.st_size, (), entry.st_dev)
+             for entry in scan_roots(root_dirs) if entry.st_size >= CHUNK_ANALYSIS_MIN_SIZE]
+    total_files = len(tasks)
+    index = ChunkIndex()
+    engine = HashEngine(SSD_READERS, HDD_READERS, DEFAULT_READERS)
+    try:
+        for processed_files, (file_path, result) in enumerate(engine.map(chunk_task, tasks), start=1):
+            engine.report_progress(processed_files, total_files)
+            if result is not None:
+                index.add(file_path, *result)
+    finally:
+        engine.shutdown()
+    engine.report_progress(total_files, total_files, force=True)
+
+    (total, unique, chunks, unique_chunks), per_group, pairs = index.analyze(
+        default_group(root_dirs), top_pairs=CHUNK_ANALYSIS_TOP_PAIRS)
+    if not chunks:
+        print("块级分析完成 没有需要分析的文件")
+        return
+
+    lines = [f"分析 {len(index.paths)} 个文件，共 {format_size(total)}，{chunks} 个块（唯一 {unique_chunks} 个）",
+             f"块级去重后 {format_size(unique)}，可节省 {format_size(total - unique)}（{(total - unique) / total:.1%}）",
+             "", "按目录（仅目录内部去重）："]
+    for name, (group_total, group_unique, _, _) in sorted(per_group.items(), key=lambda item: item[1][1] - item[1][0]):
+        saved = group_total - group_unique
+        lines.append(f"  {name}：{format_size(group_total)}，可节省 {format_size(saved)}（{saved / max(group_total, 1):.1%}）")
+    if pairs:
+        lines += ["", "共享数据最多的文件对："]
+        for shared, first, second in pairs:
+            lines.append(f"  {format_size(shared)}\n    {first}\n    {second}")
+
+    report_dir = os.path.join(root_dirs[0], DUPLICATES_DIR_NAME)
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, 'chunk_report.txt')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines[:2]))
+    print(f"详细报告：{report_path}")
+
+
+def duplicates_dir_for(file_path, root_dirs, default_dir):
+    """返回文件所在根目录（嵌套时取最深的一个）的输出目录，找不到时返回 default_dir"""
+    for root_dir in sorted(root_dirs or [], key=len, reverse=True):
+        if file_path.startswith(os.path.join(root_dir, "")):
+            return os.path.join(root_dir, DUPLICATES_DIR_NAME)
+    return default_dir
+
+
+def confirm_and_move(duplicate_groups, duplicates_dir, tree_name='duplicates_tree.txt', title="重复组",
+                     allow_link=False, root_dirs=None, entries=None):
+    """
+    生成分组列表，用户确认后把每组除第一个以外的文件移动到输出目录。
+    传入 root_dirs 时每个文件移动到它所在根目录的输出目录，避免跨卷复制；否则都移动到 duplicates_dir。
+    allow_link 为 True 时（仅限内容完全相同的文件）还可以选择原地替换为硬链接/reflink，
+    entries 为扫描时的 {路径: FileEntry}，查重后被修改过的文件不做替换。
+    """
     # 生成 duplicates_tree.txt 文件
-    tree_file = generate_duplicates_tree(duplicates_dir, duplicate_groups)
-    
+    tree_file = generate_duplicates_tree(duplicates_dir, duplicate_groups, tree_name, title)
+
     # 打印并提示用户确认
-    print(f"组列表已生成，请确认后输入 Y 移动，N 取消操作。\n查看文件：{tree_file}")
-    user_input = input("请输入 Y 或 N: ").strip().lower()
+    if allow_link:
+        print(f"组列表已生成，请确认后输入 Y 移动，L 原地替换为链接（reflink/硬链接），N 取消操作。\n查看文件：{tree_file}")
+        user_input = input("请输入 Y、L 或 N: ").strip().lower()
+    else:
+        print(f"组列表已生成，请确认后输入 Y 移动，N 取消操作。\n查看文件：{tree_file}")
+        user_input = input("请输入 Y 或 N: ").strip().lower()
 
     # 根据用户输入决定是否移动文件
     if user_input == 'y':
         for group in duplicate_groups:
-            for duplicate in group[1:]:  # 跳过第一个文件（保留最早创建的）
-                new_path = os.path.join(duplicates_dir, os.path.basename(duplicate))
+            for duplicate in group[1:]:  # 跳过第一个文件（保留的文件）
+                target_dir = duplicates_dir_for(duplicate, root_dirs, duplicates_dir)
+                os.makedirs(target_dir, exist_ok=True)
+                new_path = os.path.join(target_dir, os.path.basename(duplicate))
                 shutil.move(duplicate, new_path)
         print("文件已移动！")
-        print(f"查重完成！重复文件已移动到目录：{duplicates_dir}")
-        print(f"详细重复信息已记录在 {os.path.join(duplicates_dir, 'duplicates_tree.txt')}")
+        if root_dirs and len(root_dirs) > 1:
+            print(f"查重完成！重复文件已移动到各根目录下的 {DUPLICATES_DIR_NAME} 目录")
+        else:
+            print(f"查重完成！重复文件已移动到目录：{duplicates_dir}")
+        print(f"详细重复信息已记录在 {tree_file}")
+    elif user_input == 'l' and allow_link:
+        stats = link_duplicates(duplicate_groups, LINK_METHOD, entries)
+        print(f"已替换为链接：reflink {stats['reflink']} 个，硬链接 {stats['hardlink']} 个，失败 {stats['failed']} 个")
+        print(f"回收空间：{format_size(stats['reclaimed'])}")
+        print(f"详细重复信息已记录在 {tree_file}")
     else:
         print("操作已取消。")
-    
-    return duplicate_groups
 
 
-def generate_duplicates_tree(duplicates_dir, duplicate_groups):
+def generate_duplicates_tree(duplicates_dir, duplicate_groups, tree_name='duplicates_tree.txt', title="重复组"):
     """生成重复文件树状结构文本"""
-    tree_file = os.path.join(duplicates_dir, 'duplicates_tree.txt')
+    tree_file = os.path.join(duplicates_dir, tree_name)
     with open(tree_file, 'w', encoding='utf-8') as f:
         for idx, group in enumerate(duplicate_groups, start=1):
-            f.write(f"重复组 {idx}:\n")
+            f.write(f"{title} {idx}:\n")
             for file in group:
                 f.write(f"  {file}\n")
             f.write("\n")
@@ -101,24 +538,135 @@ def generate_duplicates_tree(duplicates_dir, duplicate_groups):
     return tree_file
 
 
-def process_directories(directories):
-    """处理多个文件夹"""
+def hash_entries(entries, hash_index, engine):
+    """计算一批文件的完整摘要（优先使用哈希索引），按顺序产出 (大小, 摘要, 路径)"""
+    tasks = []
+    by_path = {}
+    for entry in entries:
+        digest = hash_index.lookup(entry.path, entry)
+        if digest is not None:
+            yield entry.st_size, digest, entry.path
+        else:
+            by_path[entry.path] = entry
+            tasks.append((entry.path, entry.st_size, (), entry.st_dev))
+    for file, digest in engine.map(calculate_file_hash, tasks):
+        entry = by_path[file]
+        hash_index.store(file, entry, digest)
+        yield entry.st_size, digest, file
+
+
+def export_index(root_dirs, hash_index):
+    """导出本机索引分片（大小 + 摘要 + 路径，已排序），可拿到其他机器上与别的分片合并"""
+    host = socket.gethostname()
+    shard_path = os.path.join(INDEX_EXPORT_DIR, f"dedup_index_{host}.tsv.gz")
+    engine = HashEngine(SSD_READERS, HDD_READERS, DEFAULT_READERS)
+
+    def records():
+        processed_files = 0
+        batch = []
+        for entry in scan_roots(root_dirs, hash_index):
+            batch.append(entry)
+            if len(batch) >= INDEX_EXPORT_BATCH:
+                yield from hash_entries(batch, hash_index, engine)
+                processed_files += len(batch)
+                engine.report_progress(processed_files, None)
+                batch = []
+        if batch:
+            yield from hash_entries(batch, hash_index, engine)
+            processed_files += len(batch)
+        engine.report_progress(processed_files, None, force=True)
+
+    try:
+        count = write_sorted_shard(records(), shard_path, host)
+    finally:
+        engine.shutdown()
+    print(f"索引已导出：{shard_path}（{count} 条记录）")
+    return shard_path
+
+
+def merge_index_files(shard_paths):
+    """k 路归并多个主机的索引分片，找出跨主机/跨卷的重复文件，不需要在网络上搬运任何数据"""
+    shard_paths = [path.strip('"') for path in shard_paths]
+    missing = [path for path in shard_paths if not os.path.isfile(path)]
+    if missing:
+        for path in missing:
+            print(f"错误：索引文件不存在：{path}")
+        return
+
+    merged_path = os.path.join(INDEX_EXPORT_DIR, "merged_index.tsv.gz")
+    report_path = os.path.join(INDEX_EXPORT_DIR, "cross_host_duplicates.txt")
+    group_count = 0
+    reclaimable = 0
+    with open(report_path, 'w', encoding='utf-8') as f:
+        for size, digest, members in merge_shards(shard_paths, merged_path):
+            group_count += 1
+            reclaimable += size * (len(members) - 1)
+            f.write(f"重复组 {group_count}（{format_size(size)}，{digest}）:\n")
+            for host, path in members:
+                f.write(f"  {host}:{path}\n")
+            f.write("\n")
+
+    print(f"合并完成：{merged_path}")
+    print(f"发现 {group_count} 组重复文件，可回收 {format_size(reclaimable)}，详见 {report_path}")
+
+
+def process_directories(directories, mode=1):
+    """
+    处理多个文件夹。mode 1 为完全相同文件查重（所有文件夹一起查重），2 为相似图片查重，
+    3 为导出本机索引分片，5 为块级查重分析。
+    """
+    root_dirs = []
     for root_dir in directories:
         root_dir = root_dir.strip('"')  # 去掉可能的引号
         if not os.path.isdir(root_dir):
             print(f"错误：路径无效或不是文件夹：{root_dir}")
             continue
-        
-        duplicates_dir = os.path.join(root_dir, '待处理重复文件')
-        print(f"开始处理文件夹：{root_dir}")
-        
+        root_dirs.append(os.path.abspath(root_dir))
+    if not root_dirs:
+        return
+
+    hash_index = HashIndex(HASH_INDEX_FILE, HASH_ALGORITHM)
+    try:
+        for root_dir in root_dirs:
+            print(f"开始处理文件夹：{root_dir}")
+
         # 执行查重逻辑
-        size_map = group_files_by_size(root_dir)
-        process_duplicates(size_map, duplicates_dir)
-        
+        if mode == 2:
+            for root_dir in root_dirs:
+                process_similar_images(root_dir, os.path.join(root_dir, DUPLICATES_DIR_NAME), hash_index)
+        elif mode == 3:
+            export_index(root_dirs, hash_index)
+        elif mode == 5:
+            process_chunk_analysis(root_dirs)
+        else:
+            # 重复信息记录在第一个文件夹的输出目录中
+            duplicates_dir = os.path.join(root_dirs[0], DUPLICATES_DIR_NAME)
+            if OUT_OF_CORE:
+                process_duplicates_out_of_core(root_dirs, duplicates_dir, hash_index)
+            else:
+                size_map = group_files_by_size(root_dirs, hash_index)
+                process_duplicates(size_map, duplicates_dir, hash_index, root_dirs)
+
+        # 清理本次完整扫描过的目录下已删除或已修改文件的旧记录
+        hash_index.compact()
+
+        print(hash_index.stats_text())
+    finally:
+        hash_index.close()
+
 
 def main():
-    print("请输入文件夹路径，或将一个或多个路径拖入窗口后回车：")
+    print("选择查重模式：")
+    print("1. 完全相同的文件（Hash对比）")
+    print("2. 相似图片（感知哈希，可找出重新编码、缩放、去除EXIF的照片）")
+    print("3. 导出本机索引（供多台机器合并查重）")
+    print("4. 合并多个索引文件，查找跨机器的重复文件")
+    print("5. 块级查重分析（估算大部分相同的大文件按块去重可节省的空间）")
+    mode = int(input("选择模式(1): ").strip() or 1)
+    if mode == 4:
+        print("请输入索引文件路径，或将多个索引文件拖入窗口后回车：")
+    else:
+        print("请输入文件夹路径，或将一个或多个路径拖入窗口后回车：")
     while True:
         input_paths = input().strip()
         if not input_paths:
@@ -127,7 +675,10 @@ def main():
         
         # 分割多个路径（以空格区分）
         directories = input_paths.split()
-        process_directories(directories)
+        if mode == 4:
+            merge_index_files(directories)
+        else:
+            process_directories(directories, mode)
         
         print("\n处理完成！可以继续拖入文件夹路径，或直接按回车退出。")
 